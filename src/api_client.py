@@ -2,35 +2,332 @@
 Brickognize API client for LEGO piece identification.
 """
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack, contextmanager
 from typing import Dict, List, Optional
+import copy
+import hashlib
+import json
+import mmap
+import random
+import tempfile
+import threading
 import time
 import os
 
+try:
+    import orjson
+except ImportError:  # Optional speedup; falls back to the standard json module
+    orjson = None
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "sortabrick", "brickognize")
+DEFAULT_CACHE_SIZE_LIMIT = 500 * 1024 * 1024  # bytes
+
+# Map category to the appropriate endpoint
+_ENDPOINT_MAP = {
+    "parts": "/predict/parts/",
+    "sets": "/predict/sets/",
+    "figs": "/predict/figs/",
+    "general": "/predict/"
+}
+
+# Content type to upload with, by file extension
+_CONTENT_TYPE_MAP = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.bmp': 'image/bmp'
+}
+
+
+# Responses that mean the server is overloaded and we should slow down
+_OVERLOAD_STATUSES = {429, 503}
+
+# Longest wait before retrying an overloaded request, in seconds; if the server
+# asks for a longer wait, the request fails instead of holding a thread
+_MAX_RETRY_DELAY = 30.0
+
+
+class AdaptiveLimiter:
+    """
+    Adaptive limit on the number of requests in flight (additive increase, multiplicative decrease).
+
+    Starts with a single request in flight and allows one more after every
+    `increase_every` successful responses, up to `max_concurrency`. Whenever the
+    server signals overload (429/503) the limit is halved.
+    """
+
+    def __init__(self, max_concurrency: int, increase_every: int = 5):
+        """
+        Initialize the limiter.
+
+        Args:
+            max_concurrency: Upper bound for requests in flight
+            increase_every: Number of successful responses before the limit grows by one
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.increase_every = increase_every
+        self.limit = 1
+        self.in_flight = 0
+        self._successes = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Block until a request slot is free under the current limit."""
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, status_code: Optional[int] = None):
+        """
+        Free a request slot and adapt the limit to the response.
+
+        Args:
+            status_code: HTTP status of the response, or None if the request failed
+                         before getting one (leaves the limit unchanged)
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if status_code in _OVERLOAD_STATUSES:
+                self.limit = max(1, self.limit // 2)
+                self._successes = 0
+            elif status_code is not None:
+                self._successes += 1
+                if self._successes >= self.increase_every and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self._successes = 0
+            self._condition.notify_all()
+
 
 class BrickognizeClient:
     """Client for interacting with the Brickognize API."""
 
-    def __init__(self, api_url: str = "https://api.brickognize.com", delay_between_requests: float = 1.0):
+    def __init__(self, api_url: str = "https://api.brickognize.com", delay_between_requests: float = 0.25,
+                 max_workers: int = 4, use_cache: bool = True, cache_dir: str = DEFAULT_CACHE_DIR,
+                 batch_size: int = 16, max_retries: int = 4,
+                 cache_size_limit: Optional[int] = DEFAULT_CACHE_SIZE_LIMIT):
         """
         Initialize the Brickognize API client.
 
         Args:
             api_url: Base URL for the Brickognize API
-            delay_between_requests: Delay in seconds between API requests (to be respectful)
+            delay_between_requests: Minimum delay in seconds between API request starts (to be respectful)
+            max_workers: Maximum number of uploads in flight at once in identify_multiple_pieces.
+                         The actual number adapts to how the server responds.
+            use_cache: Whether to reuse stored results for images that were already identified
+            cache_dir: Directory holding cached results, keyed by image content hash
+            batch_size: Images per request when the API offers a batch endpoint (1 disables batching)
+            max_retries: How often to retry a request the server rejected as overloaded (429/503)
+            cache_size_limit: Maximum size of the cache directory in bytes; the least recently
+                              used results are removed when the client is closed (None for no limit)
         """
         self.api_url = api_url
         self.delay_between_requests = delay_between_requests
+        self.max_workers = max(1, max_workers)
+        self.use_cache = use_cache
+        self.cache_dir = cache_dir
+        self.batch_size = max(1, batch_size)
+        self.max_retries = max_retries
+        self.cache_size_limit = cache_size_limit
+        self._cache_written = False
+        self.limiter = AdaptiveLimiter(self.max_workers)
+        self._batch_endpoints = {}  # endpoint -> whether a batch variant exists
         self.last_request_time = 0
+        self._rate_limit_lock = threading.Lock()
+
+        # One pooled session so keep-alive connections are reused across the batch.
+        # Overload responses (429/503) are retried in _post instead, so the limiter sees them;
+        # urllib3 would otherwise retry them itself whenever they carry a Retry-After header.
+        self.session = requests.Session()
+        retries = Retry(total=3, backoff_factor=0.3, status_forcelist=[500, 502, 504],
+                        allowed_methods=frozenset(['GET', 'POST']), raise_on_status=False,
+                        respect_retry_after_header=False)
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers,
+                              max_retries=retries)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self):
+        """Close the underlying HTTP session and its pooled connections, and trim the cache."""
+        self.session.close()
+        if self._cache_written:
+            self._trim_cache()
+            self._cache_written = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    @contextmanager
+    def _map_image(image_path: str):
+        """
+        Memory-map an image file for hashing and uploading.
+
+        Yields a read-only buffer backed by the page cache instead of a bytes copy:
+        cache hits never load the file into Python memory, and uploads copy it
+        only once, straight into the multipart body.
+        """
+        try:
+            image_file = open(image_path, 'rb')
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Image not found: {image_path}") from None
+
+        with image_file:
+            try:
+                mapped = mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be mapped
+                yield b''
+                return
+
+            with mapped:
+                view = memoryview(mapped)
+                try:
+                    yield view
+                finally:
+                    view.release()
+
+    @staticmethod
+    def _upload_tuple(image_path: str, image_data) -> tuple:
+        """Multipart tuple (filename, file_content, content_type) for an image."""
+        ext = os.path.splitext(image_path)[1].lower()
+        return (os.path.basename(image_path), image_data, _CONTENT_TYPE_MAP.get(ext, 'image/jpeg'))
+
+    def _image_digest(self, image_path: str) -> str:
+        """Content hash of an image file, used to spot identical pieces."""
+        with self._map_image(image_path) as image_data:
+            return hashlib.blake2b(image_data).hexdigest()
+
+    def _cache_key(self, image_data, category: str, digest: Optional[str] = None) -> Optional[str]:
+        """Cache key for an image, or None when caching is disabled.
+
+        digest, if given, is the image's _image_digest and saves hashing it again.
+        """
+        if not self.use_cache:
+            return None
+        if digest is None:
+            digest = hashlib.blake2b(image_data).hexdigest()
+        return self._digest_cache_key(digest, category)
+
+    @staticmethod
+    def _digest_cache_key(digest: str, category: str) -> str:
+        """Cache key for an image with the given _image_digest."""
+        return f"{digest}_{category}"
+
+    def _cache_path(self, cache_key: str) -> str:
+        """Path of the cache file for a given key."""
+        return os.path.join(self.cache_dir, f"{cache_key}.json")
+
+    def _load_cached_result(self, cache_key: str) -> Optional[Dict]:
+        """Return the cached result for a key, or None on a miss."""
+        cache_path = self._cache_path(cache_key)
+        try:
+            with open(cache_path, 'r') as f:
+                result = json.load(f)
+            # Mark the entry as recently used, so _trim_cache keeps it
+            os.utime(cache_path)
+            return result
+        except (OSError, ValueError):
+            return None
+
+    def _save_cached_result(self, cache_key: str, result: Dict):
+        """Store a successful result; written atomically so readers never see partial files."""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with tempfile.NamedTemporaryFile('w', dir=self.cache_dir, suffix='.tmp', delete=False) as f:
+                json.dump(result, f)
+            os.replace(f.name, self._cache_path(cache_key))
+            self._cache_written = True
+        except OSError as e:
+            print(f"Warning: Could not write Brickognize cache entry: {e}")
+
+    def _trim_cache(self):
+        """Remove the least recently used cache entries until the cache fits in cache_size_limit."""
+        if self.cache_size_limit is None:
+            return
+        try:
+            entries = []
+            with os.scandir(self.cache_dir) as scanner:
+                for entry in scanner:
+                    if entry.name.endswith('.json') and entry.is_file():
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.cache_size_limit:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
 
     def _wait_for_rate_limit(self):
-        """Implement a simple rate limiting mechanism."""
-        current_time = time.time()
-        time_since_last_request = current_time - self.last_request_time
-        if time_since_last_request < self.delay_between_requests:
-            time.sleep(self.delay_between_requests - time_since_last_request)
-        self.last_request_time = time.time()
+        """
+        Implement a simple rate limiting mechanism.
 
-    def identify_piece(self, image_path: str, category: str = "parts") -> Dict:
+        Spaces out request starts, so it is shared correctly by concurrent uploads.
+        """
+        with self._rate_limit_lock:
+            current_time = time.time()
+            time_since_last_request = current_time - self.last_request_time
+            if time_since_last_request < self.delay_between_requests:
+                time.sleep(self.delay_between_requests - time_since_last_request)
+            self.last_request_time = time.time()
+
+    @staticmethod
+    def _retry_delay(response: requests.Response, attempt: int) -> Optional[float]:
+        """
+        Seconds to wait before retrying: the Retry-After header if given, else jittered exponential backoff.
+
+        Returns None if the server asks for a longer wait than _MAX_RETRY_DELAY.
+        """
+        retry_after = response.headers.get('Retry-After', '')
+        if retry_after.isdigit():
+            delay = float(retry_after)
+            return delay if delay <= _MAX_RETRY_DELAY else None
+        # The jitter keeps threads that were turned away together from retrying in lockstep
+        return min(_MAX_RETRY_DELAY, 0.5 * 2 ** attempt + random.random())
+
+    def _post(self, url: str, **kwargs) -> requests.Response:
+        """
+        POST a request under the rate limit and the adaptive concurrency limit.
+
+        Overload responses (429/503) shrink the concurrency limit and are retried
+        after a delay, up to max_retries times, unless the server asks to wait
+        longer than _MAX_RETRY_DELAY. The last response is returned either way.
+        """
+        for attempt in range(self.max_retries + 1):
+            # Take a slot before the spacing gate, so threads that were queued on the
+            # limiter are still spaced out when it lets several of them go at once
+            self.limiter.acquire()
+            status_code = None
+            try:
+                self._wait_for_rate_limit()
+                response = self.session.post(url, **kwargs)
+                status_code = response.status_code
+            finally:
+                self.limiter.release(status_code)
+
+            if response.status_code not in _OVERLOAD_STATUSES or attempt == self.max_retries:
+                return response
+            delay = self._retry_delay(response, attempt)
+            if delay is None:
+                return response
+            time.sleep(delay)
+
+    def identify_piece(self, image_path: str, category: str = "parts",
+                       digest: Optional[str] = None) -> Dict:
         """
         Identify a LEGO piece from an image.
 
@@ -38,50 +335,59 @@ class BrickognizeClient:
             image_path: Path to the image file
             category: Category to search in ('parts', 'sets', or 'figs')
                      Use 'parts' for individual LEGO pieces (default)
+            digest: The image's _image_digest, if already known
 
         Returns:
             Dictionary containing identification results
         """
-        if not os.path.exists(image_path):
-            raise FileNotFoundError(f"Image not found: {image_path}")
+        # Map the image once: the same buffer is hashed for the cache and uploaded
+        with self._map_image(image_path) as image_data:
+            return self._identify_image_data(image_path, image_data, category, digest)
+
+    def identify_image_data(self, name: str, image_data: bytes, category: str = "parts") -> Dict:
+        """
+        Identify a LEGO piece from image data in memory (e.g. from LegoSegmenter.extract_pieces_to_memory).
+
+        Uses the same result cache, rate limit and retries as identify_piece.
+
+        Args:
+            name: File name to upload the image as; its extension sets the content type
+            image_data: Encoded image (e.g. JPEG bytes)
+            category: Category to search in ('parts', 'sets', or 'figs')
 
-        # Map category to the appropriate endpoint
-        endpoint_map = {
-            "parts": "/predict/parts/",
-            "sets": "/predict/sets/",
-            "figs": "/predict/figs/",
-            "general": "/predict/"
-        }
+        Returns:
+            Dictionary containing identification results
+        """
+        return self._identify_image_data(name, image_data, category)
 
-        endpoint = endpoint_map.get(category, "/predict/parts/")
+    def _identify_image_data(self, image_path: str, image_data, category: str,
+                             digest: Optional[str] = None) -> Dict:
+        """Identify a piece from already loaded image data (see identify_piece)."""
+        endpoint = _ENDPOINT_MAP.get(category, "/predict/parts/")
 
-        # Wait for rate limiting
-        self._wait_for_rate_limit()
+        cache_key = self._cache_key(image_data, category, digest)
+        if cache_key:
+            cached = self._load_cached_result(cache_key)
+            if cached is not None:
+                return cached
 
         # Prepare the request
         url = f"{self.api_url}{endpoint}"
 
         try:
-            # Determine content type based on file extension
-            ext = os.path.splitext(image_path)[1].lower()
-            content_type_map = {
-                '.jpg': 'image/jpeg',
-                '.jpeg': 'image/jpeg',
-                '.png': 'image/png',
-                '.bmp': 'image/bmp'
+            files = {
+                'query_image': self._upload_tuple(image_path, image_data)
             }
-            content_type = content_type_map.get(ext, 'image/jpeg')
-
-            with open(image_path, 'rb') as image_file:
-                # Use tuple format: (filename, file_object, content_type)
-                files = {
-                    'query_image': (os.path.basename(image_path), image_file, content_type)
-                }
-                headers = {'accept': 'application/json'}
-                response = requests.post(url, files=files, headers=headers, timeout=30)
+            headers = {'accept': 'application/json'}
+            response = self._post(url, files=files, headers=headers, timeout=30)
 
             response.raise_for_status()
-            return response.json()
+            result = response.json()
+
+            # Only successful responses are cached; errors are retried on the next run
+            if cache_key:
+                self._save_cached_result(cache_key, result)
+            return result
 
         except requests.exceptions.HTTPError as e:
             # More detailed error for HTTP errors
@@ -99,11 +405,95 @@ class BrickognizeClient:
                 "success": False
             }
 
+    def _batch_endpoint_available(self, category: str) -> bool:
+        """
+        Check (once per endpoint) whether the API offers a multi-image batch endpoint.
+
+        Only a 2xx answer, or 405 for HEAD on a POST-only route, means the route
+        exists; redirects (e.g. to a login or docs page) and errors do not.
+        """
+        endpoint = _ENDPOINT_MAP.get(category, "/predict/parts/")
+        if endpoint not in self._batch_endpoints:
+            try:
+                response = self.session.head(f"{self.api_url}{endpoint}batch/", timeout=10)
+                self._batch_endpoints[endpoint] = (200 <= response.status_code < 300
+                                                   or response.status_code == 405)
+            except requests.exceptions.RequestException:
+                self._batch_endpoints[endpoint] = False
+        return self._batch_endpoints[endpoint]
+
+    def identify_batch(self, image_paths: List[str], category: str = "parts",
+                       digests: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Identify several LEGO pieces with a single request to the batch endpoint.
+
+        Images that are already cached are answered locally; only the rest are uploaded.
+
+        Args:
+            image_paths: List of paths to image files
+            category: Category to search in ('parts', 'sets', or 'figs')
+            digests: The images' _image_digest values, if already known
+
+        Returns:
+            List of result dictionaries, in the same order as image_paths
+
+        Raises:
+            requests.exceptions.RequestException: If the batch request fails
+            ValueError: If the response does not hold one result per uploaded image
+        """
+        with ExitStack() as stack:
+            mapped_images = [stack.enter_context(self._map_image(image_path))
+                             for image_path in image_paths]
+            return self._identify_batch_data(image_paths, mapped_images, category, digests)
+
+    def _identify_batch_data(self, image_paths: List[str], images: list, category: str,
+                             digests: Optional[List[str]] = None) -> List[Dict]:
+        """Identify several pieces from already loaded image data (see identify_batch)."""
+        results = [None] * len(image_paths)
+        pending = []
+
+        for idx, (image_path, image_data) in enumerate(zip(image_paths, images)):
+            cache_key = self._cache_key(image_data, category, digests[idx] if digests else None)
+            cached = self._load_cached_result(cache_key) if cache_key else None
+            if cached is not None:
+                results[idx] = cached
+            else:
+                pending.append((idx, image_path, image_data, cache_key))
+
+        if not pending:
+            return results
+
+        endpoint = _ENDPOINT_MAP.get(category, "/predict/parts/")
+        files = [('query_images', self._upload_tuple(image_path, image_data))
+                 for _, image_path, image_data, _ in pending]
+        headers = {'accept': 'application/json'}
+        response = self._post(f"{self.api_url}{endpoint}batch/", files=files,
+                              headers=headers, timeout=30 + 5 * len(pending))
+        response.raise_for_status()
+
+        batch_results = response.json()
+        if not isinstance(batch_results, list) or len(batch_results) != len(pending):
+            raise ValueError(f"Batch endpoint returned {type(batch_results).__name__} "
+                             f"instead of {len(pending)} results")
+
+        for (idx, _, _, cache_key), result in zip(pending, batch_results):
+            if cache_key:
+                self._save_cached_result(cache_key, result)
+            results[idx] = result
+
+        return results
+
     def identify_multiple_pieces(self, image_paths: List[str], category: str = "parts",
                                  progress_callback=None) -> List[Dict]:
         """
         Identify multiple LEGO pieces from a list of image paths.
 
+        Uploads run concurrently on up to max_workers threads; the rate limit is
+        still honored across all of them. If the API offers a batch endpoint,
+        each request carries up to batch_size images. Byte-identical images (e.g.
+        several copies of the same brick) are only sent once and share the
+        result. Results keep the order of image_paths.
+
         Args:
             image_paths: List of paths to image files
             category: Category to search in ('parts', 'sets', or 'figs')
@@ -112,24 +502,69 @@ class BrickognizeClient:
         Returns:
             List of dictionaries containing identification results for each image
         """
-        results = []
         total = len(image_paths)
+        results = [None] * total
 
+        # Group identical images so each unique image is identified once
+        duplicates = {}
         for idx, image_path in enumerate(image_paths):
-            print(f"Identifying piece {idx + 1}/{total}: {os.path.basename(image_path)}")
-
-            result = self.identify_piece(image_path, category)
-            result['image_path'] = image_path
-            result['piece_index'] = idx
-
-            results.append(result)
-
-            if progress_callback:
-                progress_callback(idx + 1, total, result)
+            duplicates.setdefault(self._image_digest(image_path), []).append(idx)
+        groups = list(duplicates.values())
+        unique_paths = [image_paths[indices[0]] for indices in groups]
+        # Passed down with the paths so no image is hashed a second time for its cache key
+        unique_digests = list(duplicates)
+
+        if len(unique_paths) < total:
+            print(f"Found {total - len(unique_paths)} duplicate images, identifying {len(unique_paths)} unique pieces")
+
+        # Only probe for the batch endpoint if several images actually need uploading
+        uploads = len(unique_paths)
+        if self.use_cache:
+            uploads = sum(not os.path.exists(self._cache_path(self._digest_cache_key(digest, category)))
+                          for digest in unique_digests)
+        use_batch = uploads > 1 and self.batch_size > 1 and self._batch_endpoint_available(category)
+        chunk_size = self.batch_size if use_batch else 1
+
+        def identify(start, chunk):
+            digests = unique_digests[start:start + len(chunk)]
+            chunk_results = None
+            if use_batch:
+                try:
+                    chunk_results = self.identify_batch(chunk, category, digests)
+                except (requests.exceptions.RequestException, ValueError) as e:
+                    # Fall back to one request per image for this and any later chunk
+                    print(f"Warning: Batch request failed ({e}), identifying pieces one by one")
+                    self._batch_endpoints[_ENDPOINT_MAP.get(category, "/predict/parts/")] = False
+            if chunk_results is None:
+                chunk_results = [self.identify_piece(image_path, category, digest)
+                                 for image_path, digest in zip(chunk, digests)]
+            return start, chunk_results
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(identify, start, unique_paths[start:start + chunk_size])
+                       for start in range(0, len(unique_paths), chunk_size)]
+
+            completed = 0
+            for future in as_completed(futures):
+                start, chunk_results = future.result()
+                for group_idx, unique_result in enumerate(chunk_results, start):
+                    # Every copy gets its own result dict with its own path and index
+                    for position, idx in enumerate(groups[group_idx]):
+                        result = unique_result if position == 0 else copy.deepcopy(unique_result)
+                        result['image_path'] = image_paths[idx]
+                        result['piece_index'] = idx
+                        results[idx] = result
+
+                        completed += 1
+                        print(f"Identified piece {completed}/{total}: {os.path.basename(image_paths[idx])}")
+
+                        if progress_callback:
+                            progress_callback(completed, total, result)
 
         return results
 
-    def format_result(self, result: Dict, top_n: int = 5) -> str:
+    @staticmethod
+    def format_result(result: Dict, top_n: int = 5) -> str:
         """
         Format an identification result for display.
 
@@ -191,8 +626,7 @@ def format_results_summary(results: List[Dict], output_file: str = None) -> str:
 
     # Individual results
     for result in results:
-        client = BrickognizeClient()
-        summary.append(client.format_result(result))
+        summary.append(BrickognizeClient.format_result(result))
 
     summary_text = "\n".join(summary)
 
@@ -201,3 +635,39 @@ def format_results_summary(results: List[Dict], output_file: str = None) -> str:
             f.write(summary_text)
 
     return summary_text
+
+
+def save_results_json(results: List[Dict], output_file: str):
+    """
+    Save identification results as indented JSON.
+
+    Uses orjson when it is installed, which is much faster than the standard
+    json module for large result lists.
+
+    Args:
+        results: List of result dictionaries
+        output_file: File path to write
+    """
+    if orjson is not None:
+        with open(output_file, 'wb') as f:
+            f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
+    else:
+        with open(output_file, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+def load_results_json(json_file: str) -> List[Dict]:
+    """
+    Load identification results saved by save_results_json.
+
+    Args:
+        json_file: Path to the JSON results file
+
+    Returns:
+        List of result dictionaries
+    """
+    if orjson is not None:
+        with open(json_file, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(json_file, 'r') as f:
+        return json.load(f)
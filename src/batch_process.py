@@ -6,16 +6,25 @@ Processes all images in a directory.
 import argparse
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from main import process_lego_image
+
+from api_client import BrickognizeClient
+from main import save_results, segment_image
+from rebrickable_client import RebrickableClient, get_api_key_from_file
 
 
 def batch_process(input_dir: str, output_dir: str = "output",
                   min_area: int = 500, max_area: int = 100000,
-                  category: str = "parts", visualize: bool = True):
+                  category: str = "parts", visualize: bool = True, use_cache: bool = True,
+                  max_workers: int = None):
     """
     Process all images in a directory.
 
+    Segmentation is CPU-bound, so all images are segmented in parallel worker
+    processes first. The pieces from every image are then identified in one
+    concurrent Brickognize batch.
+
     Args:
         input_dir: Directory containing input images
         output_dir: Base output directory
@@ -23,16 +32,19 @@ def batch_process(input_dir: str, output_dir: str = "output",
         max_area: Maximum piece area in pixels
         category: Brickognize category
         visualize: Whether to create visualizations
+        use_cache: Whether to reuse cached Brickognize results
+        max_workers: Number of segmentation processes (default: number of CPUs)
     """
     # Supported image formats
     image_extensions = {'.jpg', '.jpeg', '.png', '.bmp'}
 
-    # Find all images in input directory
-    input_path = Path(input_dir)
-    image_files = [
-        f for f in input_path.iterdir()
-        if f.is_file() and f.suffix.lower() in image_extensions
-    ]
+    # Find all images in input directory (scandir's is_file() reuses the
+    # directory listing instead of a stat call per entry)
+    with os.scandir(input_dir) as entries:
+        image_files = [
+            Path(entry.path) for entry in entries
+            if entry.is_file() and os.path.splitext(entry.name)[1].lower() in image_extensions
+        ]
 
     if not image_files:
         print(f"No images found in {input_dir}")
@@ -40,31 +52,88 @@ def batch_process(input_dir: str, output_dir: str = "output",
 
     print(f"Found {len(image_files)} images to process\n")
 
+    # Phase 1: Segment all images in parallel
+    print(f"{'=' * 80}")
+    print(f"Phase 1: Segmenting {len(image_files)} images...")
+    print(f"{'=' * 80}\n")
+
+    segmentations = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(
+                segment_image,
+                input_image=str(image_file),
+                output_dir=os.path.join(output_dir, image_file.stem),
+                min_area=min_area,
+                max_area=max_area,
+                visualize=visualize
+            ): image_file
+            for image_file in image_files
+        }
+
+        for future in as_completed(futures):
+            image_file = futures[future]
+            try:
+                segmentations[image_file] = future.result()
+            except Exception as e:
+                segmentations[image_file] = {"success": False, "error": str(e)}
+
+            segmentation = segmentations[image_file]
+            if segmentation["success"]:
+                print(f"✓ {image_file.name}: {segmentation['pieces_detected']} pieces")
+            else:
+                print(f"✗ {image_file.name}: {segmentation.get('error', 'Unknown error')}")
+
+    # Phase 2: Identify the pieces from all images in one batch
+    segmented_files = [f for f in image_files if segmentations[f]["success"]]
+    all_piece_paths = [path for f in segmented_files for path in segmentations[f]["piece_paths"]]
+
+    print(f"\n{'=' * 80}")
+    print(f"Phase 2: Identifying {len(all_piece_paths)} pieces using Brickognize API (category: {category})...")
+    print(f"{'=' * 80}\n")
+
+    identified = True
+    try:
+        with BrickognizeClient(use_cache=use_cache) as client:
+            all_results = client.identify_multiple_pieces(all_piece_paths, category=category)
+    except Exception as e:
+        print(f"✗ Error during identification: {e}")
+        identified = False
+
     results_summary = []
+    offset = 0
+
+    # One Rebrickable client for every review page, so parts shared between
+    # images are looked up once
+    rebrickable_key = get_api_key_from_file() or os.environ.get('REBRICKABLE_API_KEY')
+    rebrickable = RebrickableClient(api_key=rebrickable_key) if rebrickable_key else None
 
-    for idx, image_file in enumerate(image_files, 1):
-        print(f"\n{'=' * 80}")
-        print(f"Processing image {idx}/{len(image_files)}: {image_file.name}")
-        print(f"{'=' * 80}\n")
+    for image_file in image_files:
+        segmentation = segmentations[image_file]
+        success = segmentation["success"] and identified
 
-        # Create a subdirectory for each image's results
-        image_output_dir = os.path.join(output_dir, image_file.stem)
+        if success:
+            piece_count = len(segmentation["piece_paths"])
+            results = all_results[offset:offset + piece_count]
+            offset += piece_count
 
-        result = process_lego_image(
-            input_image=str(image_file),
-            output_dir=image_output_dir,
-            min_area=min_area,
-            max_area=max_area,
-            category=category,
-            visualize=visualize
-        )
+            # Piece indices are per image, not per batch
+            for idx, result in enumerate(results):
+                result['piece_index'] = idx
+
+            print(f"\nSaving results for {image_file.name}...")
+            save_results(results, os.path.join(output_dir, image_file.stem, "results"), image_file.stem,
+                         rebrickable_client=rebrickable)
 
         results_summary.append({
             'image': image_file.name,
-            'success': result.get('success', False),
-            'pieces_detected': result.get('pieces_detected', 0)
+            'success': success,
+            'pieces_detected': segmentation.get('pieces_detected', 0)
         })
 
+    if rebrickable:
+        rebrickable.close()
+
     # Print final summary
     print(f"\n\n{'=' * 80}")
     print("BATCH PROCESSING SUMMARY")
@@ -112,6 +181,10 @@ Example:
                        help="Brickognize search category (default: parts)")
     parser.add_argument("--no-visualize", action="store_true",
                        help="Skip creating visualizations")
+    parser.add_argument("--no-cache", action="store_true",
+                       help="Ignore cached Brickognize results and query the API again")
+    parser.add_argument("--workers", type=int, default=None,
+                       help="Number of parallel segmentation processes (default: number of CPUs)")
 
     args = parser.parse_args()
 
@@ -125,7 +198,9 @@ Example:
         min_area=args.min_area,
         max_area=args.max_area,
         category=args.category,
-        visualize=not args.no_visualize
+        visualize=not args.no_visualize,
+        use_cache=not args.no_cache,
+        max_workers=args.workers
     )
 
 
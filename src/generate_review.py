@@ -4,11 +4,11 @@ Generate a review HTML from existing JSON results.
 Useful for regenerating reviews or viewing old results.
 """
 import argparse
-import json
 import os
 import sys
 from pathlib import Path
 
+from api_client import load_results_json
 from review_generator import generate_review_html
 
 
@@ -27,6 +27,15 @@ Examples:
 
   # Show more predictions per piece
   python generate_review.py results.json --top-n 5
+
+  # Put the piece images inside the HTML file (one file to share)
+  python generate_review.py results.json --embed-images
+
+  # Also download the Rebrickable part images, so the page works offline
+  python generate_review.py results.json --embed-images --prefetch-images
+
+  # Write a gzip-compressed page (review.html.gz) for hosting or sending
+  python generate_review.py results.json --embed-images --compress gzip
         """
     )
 
@@ -37,6 +46,12 @@ Examples:
     parser.add_argument("--no-rebrickable", action="store_true",
                        help="Don't fetch images from Rebrickable API (use placeholders)")
     parser.add_argument("--api-key", help="Rebrickable API key (optional, uses env var if not provided)")
+    parser.add_argument("--embed-images", action="store_true",
+                       help="Embed piece images in the HTML instead of copying them next to it")
+    parser.add_argument("--prefetch-images", action="store_true",
+                       help="Download Rebrickable part images into the review instead of linking to them")
+    parser.add_argument("--compress", choices=["gzip"],
+                       help="Write the review gzip-compressed (adds .gz to the file name)")
 
     args = parser.parse_args()
 
@@ -48,8 +63,7 @@ Examples:
     # Load results
     print(f"Loading results from: {args.json_file}")
     try:
-        with open(args.json_file, 'r') as f:
-            results = json.load(f)
+        results = load_results_json(args.json_file)
     except Exception as e:
         print(f"Error reading JSON file: {e}")
         sys.exit(1)
@@ -64,12 +78,15 @@ Examples:
     # Generate review
     print(f"Generating review page...")
     try:
-        generate_review_html(
+        output_file = generate_review_html(
             results,
             str(output_file),
             top_n=args.top_n,
             use_rebrickable=not args.no_rebrickable,
-            api_key=args.api_key
+            api_key=args.api_key,
+            embed_images=args.embed_images,
+            prefetch_images=args.prefetch_images,
+            compress=args.compress
         )
         print(f"✓ Review page saved to: {output_file}")
         print(f"\nOpen the file in your browser to review the identifications")
@@ -7,14 +7,13 @@ import argparse
 import os
 import sys
 from pathlib import Path
-import json
 
-from api_client import BrickognizeClient, format_results_summary
+from api_client import BrickognizeClient, format_results_summary, save_results_json
 from review_generator import generate_review_html
 
 
 def identify_existing_pieces(input_dir: str, output_dir: str = "output/results",
-                             category: str = "parts") -> dict:
+                             category: str = "parts", use_cache: bool = True) -> dict:
     """
     Identify LEGO pieces from a directory of existing images.
 
@@ -22,6 +21,7 @@ def identify_existing_pieces(input_dir: str, output_dir: str = "output/results",
         input_dir: Directory containing individual piece images
         output_dir: Directory for output results
         category: Brickognize category ('parts', 'sets', or 'figs')
+        use_cache: Whether to reuse cached Brickognize results for identical images
 
     Returns:
         Dictionary with processing results
@@ -35,12 +35,13 @@ def identify_existing_pieces(input_dir: str, output_dir: str = "output/results",
 
     # Find all images in input directory
     image_extensions = {'.jpg', '.jpeg', '.png', '.bmp'}
-    input_path = Path(input_dir)
 
-    image_files = [
-        str(f) for f in input_path.iterdir()
-        if f.is_file() and f.suffix.lower() in image_extensions
-    ]
+    # scandir's is_file() reuses the directory listing instead of a stat call per entry
+    with os.scandir(input_dir) as entries:
+        image_files = [
+            entry.path for entry in entries
+            if entry.is_file() and os.path.splitext(entry.name)[1].lower() in image_extensions
+        ]
 
     if not image_files:
         print(f"No images found in {input_dir}")
@@ -56,10 +57,9 @@ def identify_existing_pieces(input_dir: str, output_dir: str = "output/results",
     print(f"Identifying pieces using Brickognize API (category: {category})...")
     print("This may take a while...\n")
 
-    client = BrickognizeClient(delay_between_requests=1.0)
-
     try:
-        results = client.identify_multiple_pieces(image_files, category=category)
+        with BrickognizeClient(use_cache=use_cache) as client:
+            results = client.identify_multiple_pieces(image_files, category=category)
         print(f"\n✓ Identification complete")
     except Exception as e:
         print(f"✗ Error during identification: {e}")
@@ -78,8 +78,7 @@ def identify_existing_pieces(input_dir: str, output_dir: str = "output/results",
     print(f"✓ Results saved to: {results_file}")
 
     # Save JSON
-    with open(json_file, 'w') as f:
-        json.dump(results, f, indent=2)
+    save_results_json(results, json_file)
     print(f"✓ JSON results saved to: {json_file}")
 
     # Generate HTML review
@@ -134,6 +133,8 @@ Examples:
                        help="Output directory for results (default: output/results)")
     parser.add_argument("--category", "-c", choices=["parts", "sets", "figs"], default="parts",
                        help="Brickognize search category (default: parts)")
+    parser.add_argument("--no-cache", action="store_true",
+                       help="Ignore cached Brickognize results and query the API again")
 
     args = parser.parse_args()
 
@@ -146,7 +147,8 @@ Examples:
     result = identify_existing_pieces(
         input_dir=args.input_dir,
         output_dir=args.output,
-        category=args.category
+        category=args.category,
+        use_cache=not args.no_cache
     )
 
     if result["success"]:
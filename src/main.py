@@ -9,33 +9,29 @@ import sys
 from pathlib import Path
 
 from segmentation import LegoSegmenter
-from api_client import BrickognizeClient, format_results_summary
+from api_client import BrickognizeClient, format_results_summary, save_results_json
 from review_generator import generate_review_html
 
 
-def process_lego_image(input_image: str, output_dir: str = "output",
-                       min_area: int = 500, max_area: int = 100000,
-                       category: str = "parts", visualize: bool = True,
-                       segment_only: bool = False) -> dict:
+def segment_image(input_image: str, output_dir: str = "output",
+                  min_area: int = 500, max_area: int = 100000,
+                  visualize: bool = True) -> dict:
     """
-    Process a LEGO image: segment pieces and identify them.
+    Segment a LEGO image and save each detected piece as its own image.
+
+    These are steps 1 and 2 of process_lego_image. They only need the CPU and
+    local disk, so batch_process runs them in worker processes.
 
     Args:
         input_image: Path to input image containing multiple LEGO pieces
         output_dir: Directory for output files
         min_area: Minimum piece area in pixels
         max_area: Maximum piece area in pixels
-        category: Brickognize category ('parts', 'sets', or 'figs')
         visualize: Whether to create a visualization of detected pieces
-        segment_only: If True, only segment the image without calling API
 
     Returns:
-        Dictionary with processing results
+        Dictionary with segmentation results, including the extracted 'piece_paths'
     """
-    print(f"\n{'=' * 80}")
-    print(f"Processing: {input_image}")
-    print(f"{'=' * 80}\n")
-
     # Create output directories
     pieces_dir = os.path.join(output_dir, "pieces")
     results_dir = os.path.join(output_dir, "results")
@@ -54,6 +50,7 @@ def process_lego_image(input_image: str, output_dir: str = "output",
         return {"success": False, "error": str(e)}
 
     # Create visualization if requested
+    vis_path = None
     if visualize:
         vis_path = os.path.join(results_dir, "detected_pieces.jpg")
         segmenter.visualize_detection(image, bounding_boxes, vis_path)
@@ -69,6 +66,92 @@ def process_lego_image(input_image: str, output_dir: str = "output",
         print(f"✗ Error during extraction: {e}")
         return {"success": False, "error": str(e)}
 
+    return {
+        "success": True,
+        "pieces_detected": len(bounding_boxes),
+        "piece_paths": piece_paths,
+        "output_files": {
+            "pieces_dir": pieces_dir,
+            "visualization": vis_path
+        }
+    }
+
+
+def save_results(results: list, results_dir: str, base_name: str,
+                 rebrickable_client=None) -> dict:
+    """
+    Save identification results as a text summary, JSON and an HTML review page.
+
+    Args:
+        results: List of identification results
+        results_dir: Directory for the result files
+        base_name: Base name for the result files
+        rebrickable_client: RebrickableClient to reuse for the review page (optional)
+
+    Returns:
+        Dictionary with the 'summary' text and the 'results_txt', 'results_json'
+        and 'review_html' paths (review_html is None if it could not be generated)
+    """
+    results_file = os.path.join(results_dir, f"{base_name}_results.txt")
+    summary = format_results_summary(results, results_file)
+    print(f"✓ Results saved to: {results_file}")
+
+    # Also save as JSON for easier processing
+    json_file = os.path.join(results_dir, f"{base_name}_results.json")
+    save_results_json(results, json_file)
+    print(f"✓ JSON results saved to: {json_file}")
+
+    # Generate HTML review
+    print("\nGenerating review page...")
+    review_file = os.path.join(results_dir, f"{base_name}_review.html")
+    try:
+        generate_review_html(results, review_file, top_n=3, client=rebrickable_client)
+        print(f"✓ Review page saved to: {review_file}")
+        print(f"  Open in browser to review identifications")
+    except Exception as e:
+        print(f"⚠ Warning: Could not generate review page: {e}")
+        review_file = None
+
+    return {
+        "summary": summary,
+        "results_txt": results_file,
+        "results_json": json_file,
+        "review_html": review_file
+    }
+
+
+def process_lego_image(input_image: str, output_dir: str = "output",
+                       min_area: int = 500, max_area: int = 100000,
+                       category: str = "parts", visualize: bool = True,
+                       segment_only: bool = False, use_cache: bool = True) -> dict:
+    """
+    Process a LEGO image: segment pieces and identify them.
+
+    Args:
+        input_image: Path to input image containing multiple LEGO pieces
+        output_dir: Directory for output files
+        min_area: Minimum piece area in pixels
+        max_area: Maximum piece area in pixels
+        category: Brickognize category ('parts', 'sets', or 'figs')
+        visualize: Whether to create a visualization of detected pieces
+        segment_only: If True, only segment the image without calling API
+        use_cache: Whether to reuse cached Brickognize results for identical piece images
+
+    Returns:
+        Dictionary with processing results
+    """
+    print(f"\n{'=' * 80}")
+    print(f"Processing: {input_image}")
+    print(f"{'=' * 80}\n")
+
+    # Steps 1 and 2: Segment the image and extract individual pieces
+    segmentation = segment_image(input_image, output_dir, min_area, max_area, visualize)
+    if not segmentation["success"]:
+        return segmentation
+
+    piece_paths = segmentation["piece_paths"]
+    pieces_dir = segmentation["output_files"]["pieces_dir"]
+
     # If segment_only is True, skip API call
     if segment_only:
         print(f"\n{'=' * 80}")
@@ -79,22 +162,18 @@ def process_lego_image(input_image: str, output_dir: str = "output",
 
         return {
             "success": True,
-            "pieces_detected": len(bounding_boxes),
+            "pieces_detected": segmentation["pieces_detected"],
             "pieces_extracted": len(piece_paths),
-            "output_files": {
-                "pieces_dir": pieces_dir,
-                "visualization": vis_path if visualize else None
-            }
+            "output_files": segmentation["output_files"]
         }
 
     # Step 3: Identify pieces using Brickognize API
     print(f"\nStep 3: Identifying pieces using Brickognize API (category: {category})...")
     print("This may take a while...\n")
 
-    client = BrickognizeClient(delay_between_requests=1.0)
-
     try:
-        results = client.identify_multiple_pieces(piece_paths, category=category)
+        with BrickognizeClient(use_cache=use_cache) as client:
+            results = client.identify_multiple_pieces(piece_paths, category=category)
         print(f"\n✓ Identification complete")
     except Exception as e:
         print(f"✗ Error during identification: {e}")
@@ -102,42 +181,22 @@ def process_lego_image(input_image: str, output_dir: str = "output",
 
     # Step 4: Save results
     print("\nStep 4: Saving results...")
-    results_file = os.path.join(results_dir, f"{base_name}_results.txt")
-    summary = format_results_summary(results, results_file)
-    print(f"✓ Results saved to: {results_file}")
-
-    # Also save as JSON for easier processing
-    import json
-    json_file = os.path.join(results_dir, f"{base_name}_results.json")
-    with open(json_file, 'w') as f:
-        json.dump(results, f, indent=2)
-    print(f"✓ JSON results saved to: {json_file}")
-
-    # Generate HTML review
-    print("\nStep 5: Generating review page...")
-    review_file = os.path.join(results_dir, f"{base_name}_review.html")
-    try:
-        generate_review_html(results, review_file, top_n=3)
-        print(f"✓ Review page saved to: {review_file}")
-        print(f"  Open in browser to review identifications")
-    except Exception as e:
-        print(f"⚠ Warning: Could not generate review page: {e}")
-        review_file = None
+    saved = save_results(results, os.path.join(output_dir, "results"), Path(input_image).stem)
 
     # Print summary to console
-    print("\n" + summary)
+    print("\n" + saved["summary"])
 
     return {
         "success": True,
-        "pieces_detected": len(bounding_boxes),
+        "pieces_detected": segmentation["pieces_detected"],
         "pieces_extracted": len(piece_paths),
         "results": results,
         "output_files": {
             "pieces_dir": pieces_dir,
-            "results_txt": results_file,
-            "results_json": json_file,
-            "review_html": review_file,
-            "visualization": vis_path if visualize else None
+            "results_txt": saved["results_txt"],
+            "results_json": saved["results_json"],
+            "review_html": saved["review_html"],
+            "visualization": segmentation["output_files"]["visualization"]
         }
     }
 
@@ -179,6 +238,8 @@ Examples:
                        help="Skip creating visualization of detected pieces")
     parser.add_argument("--segment-only", action="store_true",
                        help="Only segment pieces, skip API identification")
+    parser.add_argument("--no-cache", action="store_true",
+                       help="Ignore cached Brickognize results and query the API again")
 
     args = parser.parse_args()
 
@@ -195,7 +256,8 @@ Examples:
         max_area=args.max_area,
         category=args.category,
         visualize=not args.no_visualize,
-        segment_only=args.segment_only
+        segment_only=args.segment_only,
+        use_cache=not args.no_cache
     )
 
     if result["success"]:
@@ -2,21 +2,131 @@
 Rebrickable API client for fetching LEGO part information and images.
 """
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import atexit
+import json
 import os
+import sys
+import tempfile
+import threading
 import time
-from typing import Dict, Optional
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "sortabrick", "rebrickable_parts.json")
+
+# Number of part numbers looked up per request to the /parts/ list endpoint
+PAGE_SIZE = 100
+
+# Returned by cache lookups for keys that are not cached (None is a cached "not found")
+_MISS = object()
+
+# Clients that have not been closed yet. Held weakly, so a client that is no longer
+# used can still be freed; the ones left are flushed once when the process exits.
+_open_clients = weakref.WeakSet()
+
+
+def _flush_open_clients():
+    for client in list(_open_clients):
+        client.flush()
+
+
+atexit.register(_flush_open_clients)
+
+
+class _TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire after a time-to-live.
+
+    Empty results (None or []) use a shorter TTL so that parts missing from
+    Rebrickable are looked up again sooner than parts that were found.
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 7 * 24 * 3600,
+                 negative_ttl: float = 24 * 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._data = OrderedDict()  # key -> (value, fetched_at), least recently used first
+        self._lock = threading.Lock()
+
+    def _expired(self, value, fetched_at: float, now: float) -> bool:
+        ttl = self.ttl if value else self.negative_ttl
+        return now - fetched_at > ttl
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if it is missing or expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            if self._expired(entry[0], entry[1], time.time()):
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False
+            if self._expired(entry[0], entry[1], time.time()):
+                del self._data[key]
+                return False
+            self._data.move_to_end(key)
+            return True
+
+    def __getitem__(self, key):
+        with self._lock:
+            value, _ = self._data[key]
+            self._data.move_to_end(key)
+            return value
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def set(self, key, value, fetched_at: Optional[float] = None):
+        """Store value, evicting the least recently used entry if the cache is full."""
+        with self._lock:
+            self._data[key] = (value, time.time() if fetched_at is None else fetched_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    __setitem__ = set
+
+    def items(self) -> list:
+        """Return a snapshot of the unexpired (key, value, fetched_at) entries, oldest use first."""
+        now = time.time()
+        with self._lock:
+            return [(key, value, fetched_at) for key, (value, fetched_at) in self._data.items()
+                    if not self._expired(value, fetched_at, now)]
 
 
 class RebrickableClient:
     """Client for interacting with the Rebrickable API."""
 
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, max_workers: int = 8,
+                 cache_path: Optional[str] = DEFAULT_CACHE_PATH, cache_size: int = 10_000,
+                 cache_ttl: float = 7 * 24 * 3600, rate: float = 10.0, burst: int = 5):
         """
         Initialize the Rebrickable API client.
 
         Args:
             api_key: Rebrickable API key. If not provided, will try to read from
                     REBRICKABLE_API_KEY environment variable.
+            max_workers: Maximum number of requests in flight at once in get_parts_batch
+            cache_path: JSON file that keeps part lookups between runs (None keeps them in memory only)
+            cache_size: Maximum number of lookups to keep; the least recently used are dropped first
+            cache_ttl: Seconds before a cached lookup is fetched again (parts that were
+                      not found are retried after at most a day)
+            rate: Average number of requests per second allowed across all threads
+            burst: Number of requests that may start at once before rate applies
         """
         self.api_key = api_key or os.environ.get('REBRICKABLE_API_KEY')
         if not self.api_key:
@@ -31,17 +141,125 @@ class RebrickableClient:
             'Authorization': f'key {self.api_key}',
             'Accept': 'application/json'
         }
-        self.cache = {}  # Simple in-memory cache
-        self.last_request_time = 0
-        self.min_request_interval = 0.1  # 100ms between requests to be respectful
-
-    def _rate_limit(self):
-        """Simple rate limiting."""
-        current_time = time.time()
-        time_since_last = current_time - self.last_request_time
-        if time_since_last < self.min_request_interval:
-            time.sleep(self.min_request_interval - time_since_last)
-        self.last_request_time = time.time()
+        # Bounded in-memory cache, backed by cache_path so repeated runs skip the API
+        self.cache = _TTLCache(maxsize=cache_size, ttl=cache_ttl,
+                               negative_ttl=min(cache_ttl, 24 * 3600))
+        self.cache_path = cache_path
+        self._cache_dirty = False
+        if cache_path:
+            self._load_cache()
+            _open_clients.add(self)
+
+        # One pooled keep-alive session instead of a new TCP+TLS connection per request
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        retries = Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504],
+                        raise_on_status=False)
+        self.session.mount('https://', HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=retries))
+        self.max_workers = max(1, max_workers)
+        # Token bucket shared by all threads, to be respectful of the API
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._rate_limit_lock = threading.Lock()
+
+    def close(self):
+        """Write the cache to disk and close the underlying HTTP session."""
+        self.flush()
+        self.session.close()
+        _open_clients.discard(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _read_cache_file(self) -> dict:
+        """Return the entries stored in cache_path, or {} if it is missing or unreadable."""
+        try:
+            with open(self.cache_path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read Rebrickable cache {self.cache_path}: {e}")
+            return {}
+
+    def _load_cache(self):
+        """Load cached lookups from cache_path, if it exists."""
+        entries = self._read_cache_file()
+
+        # Entries were written least recently used first, so the LRU order survives
+        for key, entry in entries.items():
+            self.cache.set(key, entry['value'], fetched_at=entry['fetched_at'])
+
+    def _cache_get(self, key: str):
+        """Return the cached value for key, or _MISS if it has to be fetched."""
+        return self.cache.get(key, _MISS)
+
+    def _cache_set(self, key: str, value):
+        """Store a lookup result in the cache and mark it for writing to disk."""
+        self.cache.set(key, value)
+        self._cache_dirty = True
+
+    def flush(self):
+        """Write the cache to cache_path (atomically) if it has new entries."""
+        if not self.cache_path or not self._cache_dirty:
+            return
+
+        self._cache_dirty = False
+
+        # Keep what other clients wrote since this one loaded the file: their entries
+        # count as least recently used, and the newer lookup wins for shared keys
+        entries = self._read_cache_file()
+        for key, value, fetched_at in self.cache.items():
+            stored = entries.pop(key, None)
+            if stored and stored['fetched_at'] > fetched_at:
+                entries[key] = stored
+            else:
+                entries[key] = {'value': value, 'fetched_at': fetched_at}
+        if len(entries) > self.cache.maxsize:
+            entries = dict(list(entries.items())[-self.cache.maxsize:])
+
+        try:
+            cache_dir = os.path.dirname(self.cache_path) or '.'
+            os.makedirs(cache_dir, exist_ok=True)
+            with tempfile.NamedTemporaryFile('w', dir=cache_dir, suffix='.tmp', delete=False) as f:
+                json.dump(entries, f)
+            os.replace(f.name, self.cache_path)
+        except OSError as e:
+            print(f"Warning: Could not write Rebrickable cache {self.cache_path}: {e}")
+
+    def _rate_limit(self, cost: int = 1):
+        """
+        Take cost tokens from the shared bucket, waiting if it is empty.
+
+        Tokens are reserved under the lock and the wait happens outside it, so
+        threads queue up behind the bucket rate rather than behind each other's sleeps.
+        """
+        with self._rate_limit_lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            self._tokens -= cost
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+
+        if wait > 0:
+            time.sleep(wait)
+
+    @staticmethod
+    def _parse_part(item: dict) -> dict:
+        """Extract the fields we use from a Rebrickable part record."""
+        return {
+            'part_num': item.get('part_num'),
+            'name': item.get('name'),
+            'part_img_url': item.get('part_img_url'),
+            'part_url': item.get('part_url'),
+            'category_id': item.get('part_cat_id'),
+            'material': item.get('part_material')
+        }
 
     def search_by_bricklink_id(self, bricklink_id: str) -> list:
         """
@@ -54,10 +272,11 @@ class RebrickableClient:
         Returns:
             List of matching parts (may be empty, one, or multiple)
         """
-        # Check cache first
+        # Check cache first (searches share the cache with part lookups, under a "bl_" prefix)
         cache_key = f"bl_{bricklink_id}"
-        if cache_key in self.cache:
-            return self.cache[cache_key]
+        cached = self._cache_get(cache_key)
+        if cached is not _MISS:
+            return cached
 
         # Rate limit
         self._rate_limit()
@@ -69,7 +288,7 @@ class RebrickableClient:
         }
 
         try:
-            response = requests.get(url, headers=self.headers, params=params, timeout=10)
+            response = self.session.get(url, params=params, timeout=10)
 
             if response.status_code == 200:
                 data = response.json()
@@ -78,23 +297,16 @@ class RebrickableClient:
                 # Extract relevant info for each result
                 parts = []
                 for item in results:
-                    part_info = {
-                        'part_num': item.get('part_num'),
-                        'name': item.get('name'),
-                        'part_img_url': item.get('part_img_url'),
-                        'part_url': item.get('part_url'),
-                        'category_id': item.get('part_cat_id'),
-                        'material': item.get('part_material'),
-                        'bricklink_id': bricklink_id
-                    }
+                    part_info = self._parse_part(item)
+                    part_info['bricklink_id'] = bricklink_id
                     parts.append(part_info)
 
                 # Cache the results
-                self.cache[cache_key] = parts
+                self._cache_set(cache_key, parts)
                 return parts
             else:
+                # Not cached: an error status is not a real "no matches" answer
                 print(f"Warning: Rebrickable search API returned status {response.status_code} for {bricklink_id}")
-                self.cache[cache_key] = []
                 return []
 
         except requests.exceptions.RequestException as e:
@@ -113,8 +325,9 @@ class RebrickableClient:
             Dictionary with part info or list of alternatives if multiple found
         """
         # Check cache first
-        if part_num in self.cache:
-            return self.cache[part_num]
+        cached = self._cache_get(part_num)
+        if cached is not _MISS:
+            return cached
 
         # Rate limit
         self._rate_limit()
@@ -122,38 +335,20 @@ class RebrickableClient:
         url = f"{self.base_url}/parts/{part_num}/"
 
         try:
-            response = requests.get(url, headers=self.headers, timeout=10)
+            response = self.session.get(url, timeout=10)
 
             if response.status_code == 200:
                 data = response.json()
                 # Extract relevant info
-                part_info = {
-                    'part_num': data.get('part_num'),
-                    'name': data.get('name'),
-                    'part_img_url': data.get('part_img_url'),
-                    'part_url': data.get('part_url'),
-                    'category_id': data.get('part_cat_id'),
-                    'material': data.get('part_material'),
-                    'variants': []  # No variants when direct match
-                }
+                part_info = self._parse_part(data)
+                part_info['variants'] = []  # No variants when direct match
                 # Cache the result
-                self.cache[part_num] = part_info
+                self._cache_set(part_num, part_info)
                 return part_info
             elif response.status_code == 404:
                 # Part not found by exact match, try BrickLink ID search
                 print(f"Part {part_num} not found by exact match, searching by BrickLink ID...")
-                variants = self.search_by_bricklink_id(part_num)
-
-                if variants:
-                    # Return first variant as main, include all as alternatives
-                    result = variants[0].copy()
-                    result['variants'] = variants[1:] if len(variants) > 1 else []
-                    result['original_id'] = part_num
-                    self.cache[part_num] = result
-                    return result
-                else:
-                    self.cache[part_num] = None
-                    return None
+                return self._get_variants(part_num)
             else:
                 print(f"Warning: Rebrickable API returned status {response.status_code} for part {part_num}")
                 return None
@@ -162,10 +357,80 @@ class RebrickableClient:
             print(f"Warning: Failed to fetch Rebrickable data for {part_num}: {e}")
             return None
 
+    def _get_variants(self, part_num: str) -> Optional[Dict]:
+        """
+        Resolve a part number that has no exact match through the BrickLink ID search.
+
+        Args:
+            part_num: Part number that Rebrickable does not know (e.g. "3068")
+
+        Returns:
+            The first matching part, with the other matches under 'variants',
+            or None if there are no matches
+        """
+        variants = self.search_by_bricklink_id(part_num)
+
+        if variants:
+            # Return first variant as main, include all as alternatives
+            result = variants[0].copy()
+            result['variants'] = variants[1:] if len(variants) > 1 else []
+            result['original_id'] = part_num
+            self._cache_set(part_num, result)
+            return result
+        else:
+            self._cache_set(part_num, None)
+            return None
+
+    def _get_parts_multi(self, part_nums_chunk: list) -> Optional[Dict[str, Dict]]:
+        """
+        Look up several parts with a single request to the /parts/ list endpoint.
+
+        Args:
+            part_nums_chunk: Up to PAGE_SIZE part numbers
+
+        Returns:
+            Dictionary mapping each part_num that was found to its part_info
+            (parts without an exact match are missing from it), or None if the
+            request failed
+        """
+        self._rate_limit()
+
+        url = f"{self.base_url}/parts/"
+        params = {
+            'part_nums': ','.join(part_nums_chunk),
+            'page_size': len(part_nums_chunk)
+        }
+
+        try:
+            response = self.session.get(url, params=params, timeout=30)
+            if response.status_code != 200:
+                print(f"Warning: Rebrickable parts API returned status {response.status_code}")
+                return None
+            results = response.json().get('results', [])
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Warning: Failed to fetch Rebrickable parts: {e}")
+            return None
+
+        found = {}
+        for item in results:
+            part_info = self._parse_part(item)
+            part_info['variants'] = []  # No variants when direct match
+            self._cache_set(part_info['part_num'], part_info)
+            found[part_info['part_num']] = part_info
+        return found
+
     def get_parts_batch(self, part_nums: list) -> Dict[str, Optional[Dict]]:
         """
         Get information for multiple parts.
 
+        Parts that are not cached are fetched PAGE_SIZE at a time from the
+        /parts/ list endpoint. Parts it does not return have no exact match
+        (e.g. a BrickLink ID such as "3068"), so they go straight to the
+        BrickLink ID search without a separate lookup by part number. The chunk
+        requests, those searches and the lookups for chunks whose request failed
+        all run concurrently on up to max_workers threads sharing the rate limit
+        and the session's keep-alive connections.
+
         Args:
             part_nums: List of part numbers
 
@@ -173,15 +438,102 @@ class RebrickableClient:
             Dictionary mapping part_num to part_info
         """
         results = {}
-        total = len(part_nums)
+        missing = []
+        for part_num in dict.fromkeys(part_nums):
+            cached = self._cache_get(part_num)
+            if cached is _MISS:
+                missing.append(part_num)
+            else:
+                results[part_num] = cached
+
+        if not missing:
+            return {part_num: results[part_num] for part_num in part_nums}
 
-        for idx, part_num in enumerate(part_nums, 1):
-            if idx % 10 == 0:  # Progress update every 10 parts
-                print(f"  Fetching part info: {idx}/{total}")
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            remaining = []  # (lookup function, part_num) for parts the list endpoint did not resolve
+            chunks = [missing[i:i + PAGE_SIZE] for i in range(0, len(missing), PAGE_SIZE)]
+            for chunk, found in zip(chunks, executor.map(self._get_parts_multi, chunks)):
+                if found is None:
+                    remaining.extend((self.get_part_info, part_num) for part_num in chunk)
+                    continue
+                results.update(found)
+                remaining.extend((self._get_variants, part_num) for part_num in chunk if part_num not in found)
+            total = len(remaining)
 
-            results[part_num] = self.get_part_info(part_num)
+            futures = {executor.submit(lookup, part_num): part_num for lookup, part_num in remaining}
+            for idx, future in enumerate(as_completed(futures), 1):
+                if idx % 10 == 0:  # Progress update every 10 parts, rewritten in place
+                    sys.stdout.write(f"\r  Fetching part info: {idx}/{total}")
+                    sys.stdout.flush()
+
+                results[futures[future]] = future.result()
+
+        if total >= 10:
+            sys.stdout.write("\n")
+
+        # Keep the order of part_nums
+        return {part_num: results[part_num] for part_num in part_nums}
+
+    def get_part_colors(self, part_num: str) -> Optional[List[Dict]]:
+        """
+        Get the colors a part has appeared in.
+
+        Args:
+            part_num: Rebrickable part number
+
+        Returns:
+            List of colors with 'color_id', 'color_name', 'num_sets' (and 'rgb'
+            where Rebrickable gives it), or None if the request failed
+        """
+        key = f"colors_{part_num}"
+        cached = self._cache_get(key)
+        if cached is not _MISS:
+            return cached
 
-        return results
+        self._rate_limit()
+
+        url = f"{self.base_url}/parts/{part_num}/colors/"
+
+        try:
+            response = self.session.get(url, params={'page_size': 1000}, timeout=10)
+
+            if response.status_code == 200:
+                # Keep only what the review page shows
+                colors = [
+                    {field: color[field] for field in ('color_id', 'color_name', 'num_sets', 'rgb') if field in color}
+                    for color in response.json().get('results', [])
+                ]
+                self._cache_set(key, colors)
+                return colors
+            elif response.status_code == 404:
+                self._cache_set(key, [])
+                return []
+            else:
+                print(f"Warning: Rebrickable API returned status {response.status_code} for colors of {part_num}")
+                return None
+
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Warning: Failed to fetch Rebrickable colors for {part_num}: {e}")
+            return None
+
+    def get_colors_batch(self, part_nums: list) -> Dict[str, List[Dict]]:
+        """
+        Get the colors of multiple parts, fetching the uncached ones concurrently.
+
+        Args:
+            part_nums: List of part numbers
+
+        Returns:
+            Dictionary mapping part_num to its colors (parts whose request failed are left out)
+        """
+        part_nums = list(dict.fromkeys(part_nums))
+        if not part_nums:
+            return {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            colors = executor.map(self.get_part_colors, part_nums)
+            return {part_num: part_colors for part_num, part_colors in zip(part_nums, colors)
+                    if part_colors is not None}
 
 
 def get_api_key_from_file(filepath: str = ".rebrickable_key") -> Optional[str]:
@@ -1,94 +1,880 @@
 """
 Generate HTML review reports for LEGO piece identifications.
 """
+import gzip
+import hashlib
 import json
+import mimetypes
+import mmap
 import os
-from typing import Dict, List, Optional
-import base64
+import tempfile
+from contextlib import nullcontext
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import repeat
+from typing import Dict, List, NamedTuple, Optional
+from urllib.parse import quote, urlparse
 from pathlib import Path
 
+import requests
+from requests.adapters import HTTPAdapter
 
-def image_to_base64(image_path: str) -> str:
-    """Convert image to base64 for embedding in HTML."""
-    try:
-        with open(image_path, 'rb') as f:
-            return base64.b64encode(f.read()).decode('utf-8')
-    except Exception as e:
-        print(f"Warning: Could not encode image {image_path}: {e}")
-        return ""
+try:
+    from pybase64 import b64encode
+except ImportError:  # Optional speedup; falls back to the standard base64 module
+    from base64 import b64encode
+
+try:
+    from markupsafe import escape
+except ImportError:  # Optional speedup; falls back to the standard html module
+    from html import escape
+
+from rebrickable_client import RebrickableClient, get_api_key_from_file
+
+
+class PartInfo(NamedTuple):
+    """Rebrickable data shown for a part on the review page."""
+    img_url: str
+    name: str
+    part_num: str
+    variants: List[Dict]
+    original_id: str
+
+
+# Page header, split around the stylesheet tag and the piece counts so the
+# static parts are written out as they are
+_HEAD_PREFIX = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>LEGO Piece Identification Review</title>
+'''
+_HEAD_TOTAL = '''</head>
+<body>
+    <div class="header">
+        <h1>🔍 LEGO Piece Identification Review</h1>
+        <div class="stats">
+            <div class="stat-item">
+                <strong>Total Pieces:</strong> '''
+_HEAD_SUCCEEDED = '''
+            </div>
+            <div class="stat-item">
+                <strong>Successfully Identified:</strong> '''
+_HEAD_FAILED = '''
+            </div>
+            <div class="stat-item">
+                <strong>Failed:</strong> '''
+_HEAD_SUFFIX = '''
+            </div>
+        </div>
+    </div>
+'''
+
+# Markup for one prediction or variant, %-formatted by _render_prediction with the
+# template values and the parts below for the kind of block
+_PRED_TMPL = '''
+                <div %(container)s data-piece-idx="%(piece_index)s" data-part-id="%(part_num)s" data-rank="%(rank_id)s">
+                    %(badge)s
+                    <div class="images-container">%(brickognize)s
+                        <div class="image-group">
+                            <div class="image-label">Rebrickable</div>
+                            <img src="%(img_url)s" alt="Rebrickable: %(name)s" class="pred-image"%(img_style)s title="%(name)s" width="%(size)s" height="%(size)s" loading="lazy" decoding="async">
+                        </div>
+                    </div>
+                    <div class="pred-info">
+                        %(pred_id)s
+                        %(name_line)s%(details)s
+                        <div class="links">
+                            <a href="%(rebrickable_link)s" target="_blank" class="link-btn"%(link_style)s>Rebrickable</a>
+                            <a href="%(bricklink_link)s" target="_blank" class="link-btn"%(link_style)s>BrickLink</a>
+                        </div>
+                        <div class="selection-controls"%(select_style)s>
+                            <input type="checkbox"
+                                   class="select-checkbox"
+                                   id="select_%(piece_index)s_%(rank_id)s"
+                                   data-piece-idx="%(piece_index)s"
+                                   data-part-id="%(part_num)s"
+                                   %(checked_attr)s
+                                   onchange="handleSelection(this)">
+                            <label for="select_%(piece_index)s_%(rank_id)s" style="font-weight: 600; cursor: pointer;%(label_font)s">
+                                Select this %(kind)s
+                            </label>
+                        </div>
+                        <div class="selection-controls" style="margin-top: 8px;">
+                            <label style="font-weight: 600; min-width: 60px;%(label_font)s">Color:</label>
+                            <select class="color-selector"
+                                    id="color_%(piece_index)s_%(rank_id)s"
+                                    data-part-id="%(part_num)s"%(control_style)s
+                                    %(disabled_attr)s>
+                                <option value="">Loading colors...</option>
+                            </select>
+                        </div>
+                        <div class="selection-controls" style="margin-top: 8px;">
+                            <label style="font-weight: 600; min-width: 60px;%(label_font)s">Quantity:</label>
+                            <input type="number"
+                                   class="quantity-input"
+                                   id="qty_%(piece_index)s_%(rank_id)s"
+                                   min="1"
+                                   value="1"%(control_style)s
+                                   %(disabled_attr)s>
+                        </div>
+                    </div>
+                </div>
+'''
+
+_PREDICTION_PARTS = {
+    'container': 'class="prediction %(top_class)s %(selected_class)s"',
+    'badge': '<div class="rank-badge %(rank_class)s">#%(rank_id)s</div>',
+    'brickognize': '''
+                        <div class="image-group">
+                            <div class="image-label">Brickognize</div>
+                            <img src="%(brickognize_img)s" alt="Brickognize: %(item_id)s" class="pred-image" width="150" height="150" loading="lazy" decoding="async">
+                        </div>''',
+    'size': '150',
+    'img_style': '',
+    'pred_id': '<div class="pred-id">%(part_num)s%(bricklink_note)s</div>',
+    'details': '''
+                        <div style="display: flex; gap: 8px; flex-wrap: wrap;">
+                            <span class="pred-type">%(item_type)s</span>
+                            %(category_tag)s
+                        </div>
+                        <div class="confidence">
+                            Confidence: <strong>%(score_pct).1f%%</strong>
+                            <div class="confidence-bar">
+                                <div class="confidence-fill" style="width: %(score_pct)s%%"></div>
+                            </div>
+                        </div>''',
+    'link_style': '',
+    'select_style': '',
+    'label_font': '',
+    'control_style': '',
+    'kind': 'piece'
+}
+
+_VARIANT_PARTS = {
+    'container': 'class="prediction" style="border-color: #cbd5e0; background: #f7fafc; margin-bottom: 10px;"',
+    'badge': ('<div style="width: 30px; height: 30px; border-radius: 50%%; background: #cbd5e0; display: flex; '
+              'align-items: center; justify-content: center; font-size: 10px; color: #4a5568; '
+              'font-weight: bold;">V%(number)s</div>'),
+    'brickognize': '',
+    'size': '100',
+    'img_style': ' style="width: 100px; height: 100px;"',
+    'pred_id': '<div class="pred-id" style="font-size: 16px;">%(part_num)s</div>',
+    'details': '',
+    'link_style': ' style="font-size: 11px; padding: 4px 10px;"',
+    'select_style': ' style="margin-top: 8px;"',
+    'label_font': ' font-size: 13px;',
+    'control_style': ' style="font-size: 12px;"',
+    'kind': 'variant'
+}
+
+# Action bar and JavaScript at the end of the page
+_FOOTER = '''
+    <div class="action-bar">
+        <div class="selection-summary">
+            <strong id="selection-count">0</strong> pieces selected
+        </div>
+        <div class="action-buttons">
+            <button class="action-btn" onclick="saveSelections()">💾 Save Selections</button>
+            <button class="action-btn" onclick="exportJSON()">📥 Export JSON</button>
+            <button class="action-btn primary" onclick="importToRebrickable()" id="import-btn" disabled>
+                🚀 Import to Rebrickable
+            </button>
+        </div>
+    </div>
+
+    <script>
+        // Store API key and selections
+        let rebrickableApiKey = localStorage.getItem('rebrickable_api_key') || '';
+        let selections = {};  // Loaded from IndexedDB when the page opens
+        let colorCache = {};
+
+        // Part colors fetched from the API are kept in IndexedDB for a week, across page loads
+        const COLOR_CACHE_TTL = 7 * 24 * 3600 * 1000;
+
+        // Minimal IndexedDB key-value storage. Reads resolve to undefined (and writes do
+        // nothing) where IndexedDB is not available, e.g. in some private browsing modes.
+        const IDB_NAME = 'sortabrick';
+        const IDB_VERSION = 2;
+        const IDB_STORES = ['colors', 'selections'];
+        let idbOpen = null;
+
+        function openIdb() {
+            if (!idbOpen) {
+                idbOpen = new Promise((resolve, reject) => {
+                    const request = indexedDB.open(IDB_NAME, IDB_VERSION);
+                    request.onupgradeneeded = () => {
+                        for (const name of IDB_STORES) {
+                            if (!request.result.objectStoreNames.contains(name)) {
+                                request.result.createObjectStore(name);
+                            }
+                        }
+                    };
+                    request.onsuccess = () => resolve(request.result);
+                    request.onerror = () => reject(request.error);
+                });
+            }
+            return idbOpen;
+        }
+
+        async function idbTransaction(storeName, mode, callback) {
+            const db = await openIdb();
+            return new Promise((resolve, reject) => {
+                const tx = db.transaction(storeName, mode);
+                const request = callback(tx.objectStore(storeName));
+                tx.oncomplete = () => resolve(request && request.result);
+                tx.onerror = tx.onabort = () => reject(tx.error);
+            });
+        }
+
+        function idbGet(storeName, key) {
+            return idbTransaction(storeName, 'readonly', store => store.get(key)).catch(() => undefined);
+        }
+
+        function idbSet(storeName, key, value) {
+            return idbTransaction(storeName, 'readwrite', store => store.put(value, key))
+                .catch(error => console.warn(`Could not store ${key} in IndexedDB:`, error));
+        }
+
+        // Selections are stored one record per piece. Changes are collected and written
+        // in one transaction when the browser is next idle (at most a second later),
+        // or after a short delay where requestIdleCallback is not supported.
+        const SELECTION_SAVE_TIMEOUT = 1000;
+        const SELECTION_SAVE_DELAY = 100;
+        const unsavedSelections = new Set();
+        let selectionSaveScheduled = false;
+
+        async function loadSelections() {
+            const stored = {};
+            try {
+                await idbTransaction('selections', 'readonly', store => {
+                    const request = store.openCursor();
+                    request.onsuccess = () => {
+                        const cursor = request.result;
+                        if (cursor) {
+                            stored[cursor.key] = cursor.value;
+                            cursor.continue();
+                        }
+                    };
+                });
+            } catch (error) {
+                console.warn('Could not read selections from IndexedDB:', error);
+            }
+
+            // Move selections saved by earlier versions of the page out of localStorage
+            const legacy = localStorage.getItem('lego_selections');
+            if (legacy && Object.keys(stored).length === 0) {
+                Object.assign(stored, JSON.parse(legacy));
+                idbTransaction('selections', 'readwrite', store => {
+                    for (const [pieceIdx, data] of Object.entries(stored)) {
+                        store.put(data, pieceIdx);
+                    }
+                }).then(() => localStorage.removeItem('lego_selections'))
+                  .catch(error => console.warn('Could not move selections to IndexedDB:', error));
+            } else if (legacy) {
+                localStorage.removeItem('lego_selections');
+            }
+            return stored;
+        }
+
+        function queueSelectionSave(pieceIdx) {
+            unsavedSelections.add(String(pieceIdx));
+            if (selectionSaveScheduled) return;
+
+            selectionSaveScheduled = true;
+            if (window.requestIdleCallback) {
+                requestIdleCallback(saveSelectionsNow, {timeout: SELECTION_SAVE_TIMEOUT});
+            } else {
+                setTimeout(saveSelectionsNow, SELECTION_SAVE_DELAY);
+            }
+        }
+
+        function saveSelectionsNow() {
+            selectionSaveScheduled = false;
+            if (unsavedSelections.size === 0) return;
+
+            const changed = [...unsavedSelections];
+            unsavedSelections.clear();
+            idbTransaction('selections', 'readwrite', store => {
+                for (const pieceIdx of changed) {
+                    if (selections[pieceIdx]) {
+                        store.put(selections[pieceIdx], pieceIdx);
+                    } else {
+                        store.delete(pieceIdx);
+                    }
+                }
+            }).catch(error => console.warn('Could not save selections to IndexedDB:', error));
+        }
+
+        // Don't lose changes still waiting to be written
+        window.addEventListener('pagehide', saveSelectionsNow);
+
+        // Initialize on page load
+        document.addEventListener('DOMContentLoaded', async function() {
+            selections = await loadSelections();
+            loadSavedSelections();
+            fetchAllColors();
+            updateSelectionCount();
+            checkApiKey();
+        });
+
+        function checkApiKey() {
+            if (!rebrickableApiKey) {
+                rebrickableApiKey = prompt('Enter your Rebrickable API key (get it from https://rebrickable.com/api/)\\nLeave blank to skip import feature:');
+                if (rebrickableApiKey) {
+                    localStorage.setItem('rebrickable_api_key', rebrickableApiKey);
+                }
+            }
+            document.getElementById('import-btn').disabled = !rebrickableApiKey;
+        }
+
+        // Checkboxes by piece and color selectors by part, indexed on first use so that
+        // restoring or changing many selections doesn't search the whole page each time
+        let checkboxesByPiece = null;
+        let colorSelectorsByPart = null;
+
+        function indexControls() {
+            checkboxesByPiece = {};
+            colorSelectorsByPart = {};
+            document.querySelectorAll('.select-checkbox').forEach(cb => {
+                (checkboxesByPiece[cb.dataset.pieceIdx] = checkboxesByPiece[cb.dataset.pieceIdx] || []).push(cb);
+            });
+            document.querySelectorAll('select[data-part-id]').forEach(select => {
+                (colorSelectorsByPart[select.dataset.partId] = colorSelectorsByPart[select.dataset.partId] || []).push(select);
+            });
+        }
+
+        function pieceCheckboxes(pieceIdx) {
+            if (!checkboxesByPiece) indexControls();
+            return checkboxesByPiece[pieceIdx] || [];
+        }
+
+        function partColorSelectors(partId) {
+            if (!colorSelectorsByPart) indexControls();
+            return colorSelectorsByPart[partId] || [];
+        }
+
+        // saved is the stored selection when restoring one; it is shown as it was saved
+        // (the controls may not hold its values yet) and not written again
+        function handleSelection(checkbox, saved = null) {
+            const pieceIdx = checkbox.dataset.pieceIdx;
+            const partId = checkbox.dataset.partId;
+            const predictionDiv = checkbox.closest('.prediction');
+
+            // Uncheck other checkboxes for this piece
+            pieceCheckboxes(pieceIdx).forEach(cb => {
+                if (cb !== checkbox) {
+                    cb.checked = false;
+                    cb.closest('.prediction').classList.remove('selected');
+                    // Disable color/quantity for unselected
+                    const rank = cb.id.split('_')[2];
+                    document.getElementById(`color_${pieceIdx}_${rank}`).disabled = true;
+                    document.getElementById(`qty_${pieceIdx}_${rank}`).disabled = true;
+                }
+            });
+
+            // Update selected prediction
+            if (checkbox.checked) {
+                predictionDiv.classList.add('selected');
+                const rank = checkbox.id.split('_')[2];
+                document.getElementById(`color_${pieceIdx}_${rank}`).disabled = false;
+                document.getElementById(`qty_${pieceIdx}_${rank}`).disabled = false;
+
+                // Fetch colors for this part if not already cached
+                fetchColorsForPart(partId);
+
+                const colorSelect = document.getElementById(`color_${pieceIdx}_${rank}`);
+                const qtyInput = document.getElementById(`qty_${pieceIdx}_${rank}`);
+                if (saved) {
+                    // The color is selected again once the part's colors are loaded
+                    colorSelect.value = saved.color || '';
+                    qtyInput.value = saved.quantity || 1;
+                    selections[pieceIdx] = saved;
+                } else {
+                    // Store selection
+                    selections[pieceIdx] = {
+                        partId: partId,
+                        color: colorSelect.value,
+                        quantity: parseInt(qtyInput.value) || 1
+                    };
+                }
+            } else {
+                predictionDiv.classList.remove('selected');
+                delete selections[pieceIdx];
+            }
+
+            updateSelectionCount();
+            if (!saved) queueSelectionSave(pieceIdx);
+        }
+
+        function updateSelectionCount() {
+            const count = Object.keys(selections).length;
+            document.getElementById('selection-count').textContent = count;
+            document.getElementById('import-btn').disabled = count === 0 || !rebrickableApiKey;
+        }
+
+        async function fetchAllColors() {
+            // Get all unique part IDs that are selected
+            const partIds = new Set();
+            document.querySelectorAll('.select-checkbox:checked').forEach(cb => {
+                partIds.add(cb.dataset.partId);
+            });
+
+            await Promise.all([...partIds].map(fetchColorsForPart));
+        }
+
+        // Color lookups in progress, so a part is only fetched once at a time
+        const pendingColorFetch = {};
+
+        function fetchColorsForPart(partId) {
+            if (!pendingColorFetch[partId]) {
+                pendingColorFetch[partId] = loadColorsForPart(partId)
+                    .finally(() => delete pendingColorFetch[partId]);
+            }
+            return pendingColorFetch[partId];
+        }
+
+        async function loadColorsForPart(partId) {
+            if (colorCache[partId]) return;
+
+            // Colors fetched when the page was generated
+            if (window.__partColors && window.__partColors[partId]) {
+                colorCache[partId] = window.__partColors[partId];
+                updateColorSelectors(partId);
+                return;
+            }
+
+            // Colors fetched in an earlier session
+            const cached = await idbGet('colors', partId);
+            if (cached && Date.now() - cached.fetchedAt < COLOR_CACHE_TTL) {
+                colorCache[partId] = cached.results;
+                updateColorSelectors(partId);
+                return;
+            }
+            if (!rebrickableApiKey) return;
+
+            try {
+                const response = await apiSlots.run(() => fetch(
+                    `https://rebrickable.com/api/v3/lego/parts/${partId}/colors/`,
+                    {
+                        headers: {
+                            'Authorization': `key ${rebrickableApiKey}`,
+                            'Accept': 'application/json'
+                        }
+                    }
+                ));
+
+                if (response.ok) {
+                    const data = await response.json();
+                    colorCache[partId] = data.results || [];
+                    updateColorSelectors(partId);
+                    idbSet('colors', partId, {results: colorCache[partId], fetchedAt: Date.now()});
+                }
+            } catch (error) {
+                console.error(`Error fetching colors for ${partId}:`, error);
+            }
+        }
+
+        function updateColorSelectors(partId) {
+            const selectors = partColorSelectors(partId);
+            const colors = colorCache[partId] || [];
+
+            // Build the options once; each selector gets a copy, inserted in one go
+            const options = document.createDocumentFragment();
+            colors.forEach(color => {
+                const option = document.createElement('option');
+                option.value = color.color_id;
+                option.textContent = `${color.color_name} (${color.num_sets} sets)`;
+                option.style.backgroundColor = `#${color.rgb || 'ffffff'}`;
+                options.appendChild(option);
+            });
+
+            selectors.forEach(select => {
+                select.innerHTML = '<option value="">Select color...</option>';
+                select.appendChild(options.cloneNode(true));
+
+                // Restore saved selection if any
+                const pieceIdx = select.id.split('_')[1];
+                if (selections[pieceIdx] && selections[pieceIdx].color) {
+                    select.value = selections[pieceIdx].color;
+                }
+            });
+        }
+
+        // One listener for the color and quantity controls of every prediction
+        document.addEventListener('change', event => {
+            const control = event.target;
+            const isColor = control.matches('select.color-selector');
+            if (!isColor && !control.matches('input.quantity-input')) return;
+
+            const [, pieceIdx, rank] = control.id.split('_');
+            const checkbox = document.getElementById(`select_${pieceIdx}_${rank}`);
+            if (!checkbox || !checkbox.checked || !selections[pieceIdx]) return;
+
+            if (isColor) {
+                selections[pieceIdx].color = control.value;
+            } else {
+                selections[pieceIdx].quantity = parseInt(control.value) || 1;
+            }
+            queueSelectionSave(pieceIdx);
+        });
+
+        function loadSavedSelections() {
+            for (const [pieceIdx, data] of Object.entries(selections)) {
+                // Find and check the checkbox
+                const checkbox = pieceCheckboxes(pieceIdx).find(cb => cb.dataset.partId === data.partId);
+                if (checkbox) {
+                    checkbox.checked = true;
+                    handleSelection(checkbox, data);
+                }
+            }
+        }
+
+        // JSON downloads are serialized in a Web Worker, so large exports don't freeze the page.
+        // The worker sends back the finished Blob; the page falls back to building it itself.
+        const EXPORT_WORKER_SOURCE = `
+            onmessage = event => {
+                postMessage(new Blob([JSON.stringify(event.data, null, 2)], {type: 'application/json'}));
+            };
+        `;
+        let exportWorkerUrl = null;
+
+        function buildJsonBlob(data) {
+            const buildInline = () => new Blob([JSON.stringify(data, null, 2)], {type: 'application/json'});
+            if (!window.Worker) return Promise.resolve(buildInline());
+
+            return new Promise(resolve => {
+                let worker;
+                try {
+                    if (!exportWorkerUrl) {
+                        exportWorkerUrl = URL.createObjectURL(new Blob([EXPORT_WORKER_SOURCE], {type: 'text/javascript'}));
+                    }
+                    worker = new Worker(exportWorkerUrl);
+                } catch (error) {
+                    resolve(buildInline());
+                    return;
+                }
+                worker.onmessage = event => {
+                    worker.terminate();
+                    resolve(event.data);
+                };
+                worker.onerror = () => {
+                    worker.terminate();
+                    resolve(buildInline());
+                };
+                worker.postMessage(data);
+            });
+        }
 
+        async function downloadJson(data, filename) {
+            const blob = await buildJsonBlob(data);
+            const a = document.createElement('a');
+            a.href = URL.createObjectURL(blob);
+            a.download = filename;
+            a.click();
+        }
 
-def generate_review_html(results: List[Dict], output_path: str, top_n: int = 3,
-                         use_rebrickable: bool = True, api_key: Optional[str] = None) -> str:
-    """
-    Generate an HTML review page for identification results.
+        async function saveSelections() {
+            await downloadJson(selections, 'lego_selections.json');
+            alert('Selections saved to lego_selections.json');
+        }
 
-    Args:
-        results: List of identification results
-        output_path: Path to save the HTML file
-        top_n: Number of top predictions to show per piece
-        use_rebrickable: Whether to fetch images from Rebrickable API (default: True)
-        api_key: Rebrickable API key (optional, will use env var if not provided)
+        async function exportJSON() {
+            const exportData = {
+                timestamp: new Date().toISOString(),
+                totalPieces: Object.keys(selections).length,
+                pieces: []
+            };
 
-    Returns:
-        Path to the generated HTML file
-    """
+            for (const [pieceIdx, data] of Object.entries(selections)) {
+                exportData.pieces.push({
+                    pieceIndex: parseInt(pieceIdx),
+                    partId: data.partId,
+                    colorId: data.color,
+                    quantity: data.quantity || 1
+                });
+            }
 
-    # Fetch Rebrickable data if enabled
-    part_images = {}
-    if use_rebrickable:
-        try:
-            from rebrickable_client import RebrickableClient, get_api_key_from_file
+            await downloadJson(exportData, `lego_export_${Date.now()}.json`);
+            alert(`Exported ${exportData.totalPieces} pieces to JSON`);
+        }
 
-            # Try to get API key from multiple sources
-            key = api_key or get_api_key_from_file() or os.environ.get('REBRICKABLE_API_KEY')
+        // Limits for the Rebrickable import: requests in flight, requests per second
+        // and retries of a request the API turned away (429/503). Other failures are not
+        // retried: adding parts is not idempotent, and the first attempt may have been applied.
+        const IMPORT_CONCURRENCY = 6;
+        const IMPORT_RATE = 5;
+        const IMPORT_RETRIES = 4;
+        // Longest the import waits when the API asks it to (seconds); a request asked to
+        // wait longer fails instead of holding up every worker
+        const IMPORT_MAX_WAIT = 30;
+        // Parts sent per request; the API takes a list of parts in one POST
+        const IMPORT_BATCH_SIZE = 100;
+
+        function sleep(ms) {
+            return new Promise(resolve => setTimeout(resolve, ms));
+        }
 
-            if key:
-                print("Fetching part images from Rebrickable API...")
-                client = RebrickableClient(api_key=key)
-
-                # Collect all unique part numbers
-                part_nums = set()
-                for result in results:
-                    items = result.get('items', [])
-                    for item in items[:top_n]:
-                        part_num = item.get('id')
-                        if part_num:
-                            part_nums.add(part_num)
-
-                # Fetch all part info
-                if part_nums:
-                    part_data = client.get_parts_batch(list(part_nums))
-                    # Store full part data (including variants if available)
-                    for part_num, data in part_data.items():
-                        if data and data.get('part_img_url'):
-                            part_images[part_num] = {
-                                'img_url': data['part_img_url'],
-                                'name': data.get('name', ''),
-                                'part_num': data.get('part_num', part_num),
-                                'variants': data.get('variants', []),
-                                'original_id': data.get('original_id', part_num)
+        // Runs at most limit tasks at once; the others wait for a free slot
+        function makeSemaphore(limit) {
+            let active = 0;
+            const waiting = [];
+
+            return {
+                async run(task) {
+                    if (active < limit) {
+                        active++;
+                    } else {
+                        // The finishing task hands its slot over
+                        await new Promise(resolve => waiting.push(resolve));
+                    }
+                    try {
+                        return await task();
+                    } finally {
+                        if (waiting.length) {
+                            waiting.shift()();
+                        } else {
+                            active--;
+                        }
+                    }
+                }
+            };
+        }
+
+        // Color lookups share the import's limit on requests in flight
+        const apiSlots = makeSemaphore(IMPORT_CONCURRENCY);
+
+        // Token bucket shared by the import workers. The rate is halved whenever the API
+        // pushes back, and requests are held while it asks us to wait.
+        function makeRateLimiter(rate, burst) {
+            let tokens = burst;
+            let last = Date.now();
+            let pausedUntil = 0;
+
+            return {
+                async take() {
+                    for (;;) {
+                        const now = Date.now();
+                        if (now < pausedUntil) {
+                            await sleep(pausedUntil - now);
+                            continue;
+                        }
+                        tokens = Math.min(burst, tokens + (now - last) / 1000 * rate);
+                        last = now;
+                        if (tokens >= 1) {
+                            tokens -= 1;
+                            return;
+                        }
+                        await sleep((1 - tokens) / rate * 1000);
+                    }
+                },
+                pause(seconds) {
+                    pausedUntil = Math.max(pausedUntil, Date.now() + seconds * 1000);
+                },
+                backOff(seconds) {
+                    rate = Math.max(1, rate / 2);
+                    this.pause(seconds);
+                }
+            };
+        }
+
+        // Delay requested by a Retry-After header (seconds or an HTTP date), or null
+        function retryAfterSeconds(response) {
+            const value = response.headers.get('Retry-After');
+            if (!value) return null;
+            const seconds = Number(value);
+            if (!isNaN(seconds)) return Math.max(0, seconds);
+            const date = Date.parse(value);
+            return isNaN(date) ? null : Math.max(0, (date - Date.now()) / 1000);
+        }
+
+        // Jittered exponential backoff before retry number attempt, in seconds
+        function backoffSeconds(attempt) {
+            return Math.min(2 ** attempt + Math.random(), IMPORT_MAX_WAIT);
+        }
+
+        async function postToRebrickable(limiter, endpoint, payload) {
+            for (let attempt = 0; ; attempt++) {
+                await limiter.take();
+                const response = await fetch(endpoint, {
+                    method: 'POST',
+                    headers: {
+                        'Authorization': `key ${rebrickableApiKey}`,
+                        'Content-Type': 'application/json',
+                        'Accept': 'application/json'
+                    },
+                    body: JSON.stringify(payload)
+                });
+
+                // Hold off until the window resets rather than running into a 429
+                const remaining = response.headers.get('X-RateLimit-Remaining');
+                const reset = Number(response.headers.get('X-RateLimit-Reset'));
+                if (remaining === '0' && reset > 0) {
+                    // The reset is either seconds from now or a Unix timestamp
+                    const seconds = reset > 1e9 ? reset - Date.now() / 1000 : reset;
+                    limiter.pause(Math.min(seconds, IMPORT_MAX_WAIT));
+                }
+
+                // These mean the request was not processed, so it is safe to send again
+                if ((response.status === 429 || response.status === 503) && attempt < IMPORT_RETRIES) {
+                    // Overloaded: slow down every worker, not just this one
+                    const wait = retryAfterSeconds(response);
+                    if (wait !== null && wait > IMPORT_MAX_WAIT) {
+                        // The caller reports the failure
+                        return response;
+                    }
+                    limiter.backOff(wait !== null ? wait : backoffSeconds(attempt));
+                    continue;
+                }
+                return response;
+            }
+        }
+
+        async function importToRebrickable() {
+            if (!rebrickableApiKey) {
+                alert('Please set your Rebrickable API key first');
+                checkApiKey();
+                return;
+            }
+
+            if (Object.keys(selections).length === 0) {
+                alert('No pieces selected to import');
+                return;
+            }
+
+            const userSetId = prompt('Enter your Rebrickable user set ID (or leave blank to skip)\\nFind it at: https://rebrickable.com/users/YOUR_USERNAME/sets/');
+
+            if (!confirm(`Import ${Object.keys(selections).length} pieces to Rebrickable?`)) {
+                return;
+            }
+
+            const importBtn = document.getElementById('import-btn');
+            importBtn.disabled = true;
+            importBtn.textContent = '⏳ Importing...';
+
+            const endpoint = userSetId
+                ? `https://rebrickable.com/api/v3/users/me/sets/${userSetId}/parts/`
+                : 'https://rebrickable.com/api/v3/users/me/parts/';
+            const limiter = makeRateLimiter(IMPORT_RATE, IMPORT_CONCURRENCY);
+            const total = Object.keys(selections).length;
+
+            let successCount = 0;
+            let failCount = 0;
+            const failures = [];  // Messages shown to the user at the end
+
+            const parts = [];
+            for (const [pieceIdx, data] of Object.entries(selections)) {
+                if (!data.color) {
+                    console.warn(`Skipping piece ${pieceIdx}: no color selected`);
+                    failures.push(`piece ${pieceIdx}: no color selected`);
+                    failCount++;
+                    continue;
+                }
+                parts.push({
+                    pieceIdx: pieceIdx,
+                    payload: {
+                        part_num: data.partId,
+                        color_id: parseInt(data.color),
+                        quantity: data.quantity || 1
+                    }
+                });
+            }
+
+            // Each task is a batch of parts added with one request
+            const queue = [];
+            for (let i = 0; i < parts.length; i += IMPORT_BATCH_SIZE) {
+                queue.push(parts.slice(i, i + IMPORT_BATCH_SIZE));
+            }
+
+            async function importWorker() {
+                let batch;
+                while ((batch = queue.shift())) {
+                    const label = batch.length === 1 ? `piece ${batch[0].pieceIdx}` : `${batch.length} pieces`;
+                    try {
+                        // Add the parts to the user's collection
+                        const payload = batch.length === 1 ? batch[0].payload : batch.map(part => part.payload);
+                        const response = await postToRebrickable(limiter, endpoint, payload);
+
+                        if (response.ok) {
+                            successCount += batch.length;
+                        } else if (batch.length > 1 && response.status === 400) {
+                            // The batch failed validation (e.g. one bad part); add its parts one at a time.
+                            // Other errors (bad key or set, rate limit) would only fail once per part.
+                            console.warn(`Batch of ${batch.length} pieces refused, importing them one by one:`, await response.text());
+                            queue.push(...batch.map(part => [part]));
+                            startWorkers();
+                        } else {
+                            const text = await response.text();
+                            console.error(`Failed to import ${label}:`, text);
+                            if (response.status === 429 || response.status === 503) {
+                                const wait = retryAfterSeconds(response);
+                                failures.push(`${label}: Rebrickable is busy` +
+                                    (wait !== null ? ` and asked to wait ${Math.ceil(wait)} s` : '') + ', try again later');
+                            } else {
+                                failures.push(`${label}: HTTP ${response.status} ${text.slice(0, 100)}`);
                             }
-                    print(f"✓ Fetched images for {len(part_images)} parts")
-                else:
-                    print("No parts to fetch from Rebrickable")
-            else:
-                print("⚠ Rebrickable API key not found - using placeholder images")
-                print("  Set REBRICKABLE_API_KEY environment variable or create .rebrickable_key file")
-                print("  Get your free API key at: https://rebrickable.com/api/")
-        except ImportError:
-            print("⚠ rebrickable_client module not found - using placeholder images")
-        except Exception as e:
-            print(f"⚠ Could not fetch Rebrickable data: {e}")
-            print("  Continuing with placeholder images...")
+                            failCount += batch.length;
+                        }
+                    } catch (error) {
+                        // Not retried: the parts may have been added before the connection failed
+                        console.error(`Error importing ${label}:`, error);
+                        failures.push(`${label}: ${error.message} (check your collection before importing again)`);
+                        failCount += batch.length;
+                    }
+                    importBtn.textContent = `⏳ Importing... ${successCount + failCount}/${total}`;
+                }
+            }
 
-    html_parts = ['''<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>LEGO Piece Identification Review</title>
-    <style>
+            // Workers that found the queue empty have exited, so more are started when parts are requeued
+            const running = new Set();
+            function startWorkers() {
+                while (running.size < IMPORT_CONCURRENCY && running.size < queue.length) {
+                    const worker = importWorker().finally(() => running.delete(worker));
+                    running.add(worker);
+                }
+            }
+
+            startWorkers();
+            while (running.size) {
+                await Promise.all([...running]);
+            }
+
+            importBtn.disabled = false;
+            importBtn.textContent = '🚀 Import to Rebrickable';
+
+            let message = `Import complete!\\n✓ Success: ${successCount}\\n✗ Failed: ${failCount}`;
+            if (failures.length) {
+                message += '\\n\\n' + failures.slice(0, 5).join('\\n');
+                if (failures.length > 5) message += `\\n... and ${failures.length - 5} more (see the console)`;
+            }
+            alert(message);
+        }
+    </script>
+</body>
+</html>'''
+
+# Stands in for the piece image's data URI in rendered pieces when images are embedded;
+# the base64 is streamed into the page in its place
+_IMAGE_MARKER = "\0piece-image\0"
+
+# Bytes of image read per base64 chunk (a multiple of 3, so chunks encode without padding)
+_BASE64_CHUNK = 3 * 1024 * 64
+
+# Threads reading embedded piece images ahead of the page writer
+_READ_AHEAD_WORKERS = 8
+
+# Shown in place of part images that are not available
+_NO_IMAGE_SVG = "data:image/svg+xml,<svg xmlns='http://www.w3.org/2000/svg' width='150' height='150'><rect fill='%23eee' width='150' height='150'/><text x='50%' y='50%' text-anchor='middle' dy='.3em' fill='%23999' font-size='12'>No Image</text></svg>"
+_NO_IMAGE_SVG_SM = "data:image/svg+xml,<svg xmlns='http://www.w3.org/2000/svg' width='100' height='100'><rect fill='%23eee' width='100' height='100'/><text x='50%' y='50%' text-anchor='middle' dy='.3em' fill='%23999' font-size='10'>No Image</text></svg>"
+
+# Catalog pages linked from each prediction (%-formatted with the part number)
+_REBRICKABLE_PART_URL = "https://rebrickable.com/parts/%s/"
+_BRICKLINK_PART_URL = "https://www.bricklink.com/v2/catalog/catalogitem.page?P=%s"
+
+# Stylesheet for the review page, written to styles.css next to it (or inlined with embed_images)
+_CSS = """\
         body {
             font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, sans-serif;
             margin: 0;
@@ -398,532 +1184,574 @@ def generate_review_html(results: List[Dict], output_path: str, top_n: int = 3,
                 align-items: center;
             }
         }
-    </style>
-</head>
-<body>
-    <div class="header">
-        <h1>🔍 LEGO Piece Identification Review</h1>
-        <div class="stats">
-            <div class="stat-item">
-                <strong>Total Pieces:</strong> ''' + str(len(results)) + '''
-            </div>
-            <div class="stat-item">
-                <strong>Successfully Identified:</strong> ''' + str(sum(1 for r in results if r.get('items') and not r.get('error'))) + '''
-            </div>
-            <div class="stat-item">
-                <strong>Failed:</strong> ''' + str(sum(1 for r in results if r.get('error') or not r.get('items'))) + '''
-            </div>
-        </div>
-    </div>
-''']
+"""
 
-    # Generate piece sections
-    for idx, result in enumerate(results):
-        piece_index = result.get('piece_index', idx)
-        image_path = result.get('image_path', '')
 
-        # Encode image
-        img_data = ""
-        if os.path.exists(image_path):
-            img_data = image_to_base64(image_path)
+def image_to_base64(image_path: str) -> str:
+    """Convert image to base64 for embedding in HTML ("" if the image does not exist)."""
+    try:
+        with open(image_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return ""
+            # Encode straight from the mapped file instead of reading it into a bytes copy first
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return b64encode(mm).decode('ascii')
+    except FileNotFoundError:
+        return ""
+    except Exception as e:
+        print(f"Warning: Could not encode image {image_path}: {e}")
+        return ""
 
-        html_parts.append(f'''
-    <div class="piece-container">
-        <div class="piece-header">
-            <div class="piece-number">#{piece_index + 1}</div>
-            <div class="piece-title">
-                <h2 style="margin: 0;">Piece {piece_index + 1}</h2>
-                <small style="color: #718096;">{os.path.basename(image_path)}</small>
-            </div>
-        </div>
-        <div class="piece-content">
-            <div class="captured-image">
-                <div class="captured-label">YOUR PIECE</div>
-''')
 
-        if img_data:
-            html_parts.append(f'                <img src="data:image/jpeg;base64,{img_data}" alt="Piece {piece_index + 1}">\n')
-        else:
-            html_parts.append('                <div style="padding: 50px; text-align: center; color: #a0aec0;">Image not available</div>\n')
+def _read_image(image_path: str) -> bytes:
+    """Read an image file (b"" if it cannot be read)."""
+    try:
+        with open(image_path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return b""
 
-        html_parts.append('            </div>\n            <div class="predictions">\n')
 
-        # Handle errors
-        if result.get('error'):
-            html_parts.append(f'''
-                <div class="error-message">
-                    <strong>Error:</strong> {result['error']}
-                </div>
-''')
-        elif not result.get('items'):
-            html_parts.append('                <div class="no-results">No matching pieces found</div>\n')
-        else:
-            # Show predictions
-            items = result.get('items', [])[:top_n]
-            for rank, item in enumerate(items, 1):
-                item_id = item.get('id', 'Unknown')
-                item_type = item.get('type', 'part')
-                score = item.get('score', 0)
-                item_name = item.get('name', '')
-                item_category = item.get('category', '')
-
-                # Brickognize image from API results
-                brickognize_img = item.get('img_url', '')
-                if not brickognize_img:
-                    brickognize_img = "data:image/svg+xml,<svg xmlns='http://www.w3.org/2000/svg' width='150' height='150'><rect fill='%23eee' width='150' height='150'/><text x='50%' y='50%' text-anchor='middle' dy='.3em' fill='%23999' font-size='12'>No Image</text></svg>"
-
-                rank_class = f"rank-{rank}" if rank <= 3 else "rank-other"
-                top_class = "top" if rank == 1 else ""
-
-                # Get Rebrickable image URL or use placeholder
-                matched_part_num = item_id
-                part_variants = []
-                if item_id in part_images:
-                    rebrickable_img_url = part_images[item_id]['img_url']
-                    rebrickable_name = part_images[item_id].get('name', item_id)
-                    matched_part_num = part_images[item_id].get('part_num', item_id)
-                    part_variants = part_images[item_id].get('variants', [])
-                else:
-                    rebrickable_img_url = "data:image/svg+xml,<svg xmlns='http://www.w3.org/2000/svg' width='150' height='150'><rect fill='%23eee' width='150' height='150'/><text x='50%' y='50%' text-anchor='middle' dy='.3em' fill='%23999' font-size='12'>No Image</text></svg>"
-                    rebrickable_name = item_id
+def _read_ahead(executor: ThreadPoolExecutor, paths: List[str], window: int):
+    """
+    Read files on a thread pool, yielding their contents in order.
 
-                # Use Rebrickable name if item name not available
-                display_name = item_name if item_name else rebrickable_name
+    At most window reads are in flight or waiting to be consumed, so the
+    memory used stays bounded however many images the page has.
 
-                # Links (use matched part number for Rebrickable, original for BrickLink)
-                rebrickable_link = f"https://rebrickable.com/parts/{matched_part_num}/"
-                bricklink_link = f"https://www.bricklink.com/v2/catalog/catalogitem.page?P={item_id}"
+    Args:
+        executor: Thread pool to read on
+        paths: Paths of the files to read
+        window: Number of files to read ahead of the consumer
+    """
+    pending = deque()
+    for path in paths:
+        pending.append(executor.submit(_read_image, path))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
 
-                # Auto-select if it's the only prediction or first with high confidence
-                should_preselect = (len(items) == 1) or (rank == 1 and score > 0.7)
-                selected_class = "selected" if should_preselect else ""
-                checked_attr = "checked" if should_preselect else ""
 
-                html_parts.append(f'''
-                <div class="prediction {top_class} {selected_class}" data-piece-idx="{piece_index}" data-part-id="{matched_part_num}" data-rank="{rank}">
-                    <div class="rank-badge {rank_class}">#{rank}</div>
-                    <div class="images-container">
-                        <div class="image-group">
-                            <div class="image-label">Brickognize</div>
-                            <img src="{brickognize_img}" alt="Brickognize: {item_id}" class="pred-image">
-                        </div>
-                        <div class="image-group">
-                            <div class="image-label">Rebrickable</div>
-                            <img src="{rebrickable_img_url}" alt="Rebrickable: {display_name}" class="pred-image" title="{display_name}">
-                        </div>
-                    </div>
-                    <div class="pred-info">
-                        <div class="pred-id">{matched_part_num}{f' <span style="font-size: 12px; color: #718096;">(BrickLink: {item_id})</span>' if matched_part_num != item_id else ''}</div>
-                        {f'<div style="font-size: 14px; color: #4a5568; margin-bottom: 5px;"><strong>{display_name}</strong></div>' if display_name and display_name != matched_part_num else ''}
-                        <div style="display: flex; gap: 8px; flex-wrap: wrap;">
-                            <span class="pred-type">{item_type}</span>
-                            {f'<span class="pred-type" style="background: #e6fffa; color: #234e52;">{item_category}</span>' if item_category else ''}
-                        </div>
-                        <div class="confidence">
-                            Confidence: <strong>{score * 100:.1f}%</strong>
-                            <div class="confidence-bar">
-                                <div class="confidence-fill" style="width: {score * 100}%"></div>
-                            </div>
-                        </div>
-                        <div class="links">
-                            <a href="{rebrickable_link}" target="_blank" class="link-btn">Rebrickable</a>
-                            <a href="{bricklink_link}" target="_blank" class="link-btn">BrickLink</a>
-                        </div>
-                        <div class="selection-controls">
-                            <input type="checkbox"
-                                   class="select-checkbox"
-                                   id="select_{piece_index}_{rank}"
-                                   data-piece-idx="{piece_index}"
-                                   data-part-id="{matched_part_num}"
-                                   {checked_attr}
-                                   onchange="handleSelection(this)">
-                            <label for="select_{piece_index}_{rank}" style="font-weight: 600; cursor: pointer;">
-                                Select this piece
-                            </label>
-                        </div>
-                        <div class="selection-controls" style="margin-top: 8px;">
-                            <label style="font-weight: 600; min-width: 60px;">Color:</label>
-                            <select class="color-selector"
-                                    id="color_{piece_index}_{rank}"
-                                    data-part-id="{matched_part_num}"
-                                    {'' if should_preselect else 'disabled'}>
-                                <option value="">Loading colors...</option>
-                            </select>
-                        </div>
-                        <div class="selection-controls" style="margin-top: 8px;">
-                            <label style="font-weight: 600; min-width: 60px;">Quantity:</label>
-                            <input type="number"
-                                   class="quantity-input"
-                                   id="qty_{piece_index}_{rank}"
-                                   min="1"
-                                   value="1"
-                                   {'' if should_preselect else 'disabled'}>
-                        </div>
-                    </div>
-                </div>
-''')
+def _write_base64_image(out, data: bytes):
+    """
+    Write an image to out as a base64 data URI, encoding it a chunk at a time.
 
-                # Add variant alternatives if they exist
-                if part_variants:
-                    html_parts.append(f'''
-                <div style="margin-left: 95px; margin-top: 10px; padding-left: 15px; border-left: 3px solid #e2e8f0;">
-                    <div style="font-size: 12px; font-weight: 600; color: #718096; margin-bottom: 10px;">
-                        ⚡ ALTERNATIVE VARIANTS FOR {item_id}:
-                    </div>
-''')
-                    for variant_idx, variant in enumerate(part_variants):
-                        variant_part_num = variant.get('part_num', '')
-                        variant_name = variant.get('name', '')
-                        variant_img_url = variant.get('part_img_url', '')
-
-                        if not variant_img_url:
-                            variant_img_url = "data:image/svg+xml,<svg xmlns='http://www.w3.org/2000/svg' width='100' height='100'><rect fill='%23eee' width='100' height='100'/><text x='50%' y='50%' text-anchor='middle' dy='.3em' fill='%23999' font-size='10'>No Image</text></svg>"
-
-                        variant_rebrickable_link = f"https://rebrickable.com/parts/{variant_part_num}/"
-                        variant_bricklink_link = f"https://www.bricklink.com/v2/catalog/catalogitem.page?P={variant_part_num}"
-
-                        variant_rank_id = f"{rank}_var{variant_idx}"
-
-                        html_parts.append(f'''
-                    <div class="prediction" style="border-color: #cbd5e0; background: #f7fafc; margin-bottom: 10px;" data-piece-idx="{piece_index}" data-part-id="{variant_part_num}" data-rank="{variant_rank_id}">
-                        <div style="width: 30px; height: 30px; border-radius: 50%; background: #cbd5e0; display: flex; align-items: center; justify-content: center; font-size: 10px; color: #4a5568; font-weight: bold;">V{variant_idx + 1}</div>
-                        <div class="images-container">
-                            <div class="image-group">
-                                <div class="image-label">Rebrickable</div>
-                                <img src="{variant_img_url}" alt="Rebrickable: {variant_name}" class="pred-image" style="width: 100px; height: 100px;" title="{variant_name}">
-                            </div>
-                        </div>
-                        <div class="pred-info">
-                            <div class="pred-id" style="font-size: 16px;">{variant_part_num}</div>
-                            {f'<div style="font-size: 13px; color: #4a5568; margin-bottom: 5px;"><strong>{variant_name}</strong></div>' if variant_name and variant_name != variant_part_num else ''}
-                            <div class="links">
-                                <a href="{variant_rebrickable_link}" target="_blank" class="link-btn" style="font-size: 11px; padding: 4px 10px;">Rebrickable</a>
-                                <a href="{variant_bricklink_link}" target="_blank" class="link-btn" style="font-size: 11px; padding: 4px 10px;">BrickLink</a>
-                            </div>
-                            <div class="selection-controls" style="margin-top: 8px;">
-                                <input type="checkbox"
-                                       class="select-checkbox"
-                                       id="select_{piece_index}_{variant_rank_id}"
-                                       data-piece-idx="{piece_index}"
-                                       data-part-id="{variant_part_num}"
-                                       onchange="handleSelection(this)">
-                                <label for="select_{piece_index}_{variant_rank_id}" style="font-weight: 600; cursor: pointer; font-size: 13px;">
-                                    Select this variant
-                                </label>
-                            </div>
-                            <div class="selection-controls" style="margin-top: 8px;">
-                                <label style="font-weight: 600; min-width: 60px; font-size: 13px;">Color:</label>
-                                <select class="color-selector"
-                                        id="color_{piece_index}_{variant_rank_id}"
-                                        data-part-id="{variant_part_num}"
-                                        style="font-size: 12px;"
-                                        disabled>
-                                    <option value="">Loading colors...</option>
-                                </select>
-                            </div>
-                            <div class="selection-controls" style="margin-top: 8px;">
-                                <label style="font-weight: 600; min-width: 60px; font-size: 13px;">Quantity:</label>
-                                <input type="number"
-                                       class="quantity-input"
-                                       id="qty_{piece_index}_{variant_rank_id}"
-                                       min="1"
-                                       value="1"
-                                       style="font-size: 12px;"
-                                       disabled>
-                            </div>
-                        </div>
-                    </div>
-''')
+    Writes the "No Image" placeholder instead if the image is missing or empty.
+
+    Args:
+        out: Text file the page is being written to
+        data: Contents of the image file (b"" if it could not be read)
+    """
+    if not data:
+        out.write(_NO_IMAGE_SVG)
+        return
+
+    out.write("data:image/jpeg;base64,")
+    view = memoryview(data)
+    for start in range(0, len(view), _BASE64_CHUNK):
+        out.write(b64encode(view[start:start + _BASE64_CHUNK]).decode('ascii'))
+
+
+def _asset_name(data: bytes, suffix: str) -> str:
+    """File name for image data in the assets directory, derived from its contents."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest() + suffix
+
+
+def _write_asset(data: bytes, suffix: str, out_dir: Path) -> str:
+    """
+    Write image data into out_dir under a name derived from its contents.
+
+    Identical images share one file, and an image that is already there is
+    not written again, so regenerating a report only writes new images.
+
+    Args:
+        data: Image bytes
+        suffix: File extension, including the dot
+        out_dir: Assets directory next to the HTML file
+
+    Returns:
+        File name of the image inside out_dir
+    """
+    name = _asset_name(data, suffix)
+    dest = out_dir / name
+    if not dest.exists():
+        with tempfile.NamedTemporaryFile('wb', dir=out_dir, suffix='.tmp', delete=False) as tmp:
+            tmp.write(data)
+        os.replace(tmp.name, dest)
+    return name
+
+
+def _copy_image(src: str, out_dir: Path) -> str:
+    """
+    Add an image to the assets directory (see _write_asset).
 
-                    html_parts.append('                </div>\n')
+    The image is hard-linked where possible, so no data is written, and
+    copied when it is not (e.g. the assets are on another file system).
 
-        html_parts.append('            </div>\n        </div>\n    </div>\n')
+    Args:
+        src: Path to the image
+        out_dir: Assets directory next to the HTML file
 
-    # Add action bar and JavaScript
-    html_parts.append('''
-    <div class="action-bar">
-        <div class="selection-summary">
-            <strong id="selection-count">0</strong> pieces selected
-        </div>
-        <div class="action-buttons">
-            <button class="action-btn" onclick="saveSelections()">💾 Save Selections</button>
-            <button class="action-btn" onclick="exportJSON()">📥 Export JSON</button>
-            <button class="action-btn primary" onclick="importToRebrickable()" id="import-btn" disabled>
-                🚀 Import to Rebrickable
-            </button>
-        </div>
-    </div>
+    Returns:
+        File name of the image inside out_dir ("" if the image does not exist or could not be read)
+    """
+    try:
+        with open(src, 'rb') as f:
+            data = f.read()
+        suffix = Path(src).suffix.lower()
+        name = _asset_name(data, suffix)
+        dest = out_dir / name
+        if not dest.exists():
+            try:
+                os.link(src, dest)
+            except FileExistsError:
+                pass
+            except OSError:
+                _write_asset(data, suffix, out_dir)
+        return name
+    except FileNotFoundError:
+        return ""
+    except OSError as e:
+        print(f"Warning: Could not copy image {src}: {e}")
+        return ""
 
-    <script>
-        // Store API key and selections
-        let rebrickableApiKey = localStorage.getItem('rebrickable_api_key') || '';
-        let selections = JSON.parse(localStorage.getItem('lego_selections') || '{}');
-        let colorCache = {};
 
-        // Initialize on page load
-        document.addEventListener('DOMContentLoaded', function() {
-            loadSavedSelections();
-            fetchAllColors();
-            updateSelectionCount();
-            checkApiKey();
-        });
+def _download_image(session: requests.Session, url: str) -> bytes:
+    """Download an image, returning b"" if it could not be fetched."""
+    try:
+        response = session.get(url, timeout=30)
+        response.raise_for_status()
+        return response.content
+    except requests.exceptions.RequestException as e:
+        print(f"Warning: Could not download image {url}: {e}")
+        return b""
 
-        function checkApiKey() {
-            if (!rebrickableApiKey) {
-                rebrickableApiKey = prompt('Enter your Rebrickable API key (get it from https://rebrickable.com/api/)\\nLeave blank to skip import feature:');
-                if (rebrickableApiKey) {
-                    localStorage.setItem('rebrickable_api_key', rebrickableApiKey);
-                }
-            }
-            document.getElementById('import-btn').disabled = !rebrickableApiKey;
-        }
 
-        function handleSelection(checkbox) {
-            const pieceIdx = checkbox.dataset.pieceIdx;
-            const partId = checkbox.dataset.partId;
-            const predictionDiv = checkbox.closest('.prediction');
+def _write_stylesheet(output_path: str) -> str:
+    """
+    Write _CSS to styles.css next to the page, unless it is already there.
 
-            // Uncheck other checkboxes for this piece
-            document.querySelectorAll(`input[data-piece-idx="${pieceIdx}"]`).forEach(cb => {
-                if (cb !== checkbox) {
-                    cb.checked = false;
-                    cb.closest('.prediction').classList.remove('selected');
-                    // Disable color/quantity for unselected
-                    const rank = cb.id.split('_')[2];
-                    document.getElementById(`color_${pieceIdx}_${rank}`).disabled = true;
-                    document.getElementById(`qty_${pieceIdx}_${rank}`).disabled = true;
-                }
-            });
+    Args:
+        output_path: Path of the HTML file
 
-            // Update selected prediction
-            if (checkbox.checked) {
-                predictionDiv.classList.add('selected');
-                const rank = checkbox.id.split('_')[2];
-                document.getElementById(`color_${pieceIdx}_${rank}`).disabled = false;
-                document.getElementById(`qty_${pieceIdx}_${rank}`).disabled = false;
+    Returns:
+        Stylesheet URL for the page, with a version query so browsers
+        reload it only when the CSS changes
+    """
+    css_path = Path(output_path).parent / 'styles.css'
+    try:
+        current = css_path.read_text(encoding='utf-8')
+    except OSError:
+        current = None
+    if current != _CSS:
+        css_path.write_text(_CSS, encoding='utf-8')
+    return f"styles.css?v={hashlib.blake2b(_CSS.encode('utf-8'), digest_size=4).hexdigest()}"
 
-                // Fetch colors for this part if not already cached
-                fetchColorsForPart(partId);
 
-                // Store selection
-                selections[pieceIdx] = {
-                    partId: partId,
-                    color: document.getElementById(`color_${pieceIdx}_${rank}`).value,
-                    quantity: parseInt(document.getElementById(`qty_${pieceIdx}_${rank}`).value) || 1
-                };
-            } else {
-                predictionDiv.classList.remove('selected');
-                delete selections[pieceIdx];
-            }
+def _esc(value) -> str:
+    """
+    Escape a value from an API response for use in HTML text or a quoted attribute.
 
-            updateSelectionCount();
-            localStorage.setItem('lego_selections', JSON.stringify(selections));
-        }
+    Each value is escaped once, where the template values are prepared, and the
+    escaped string is reused wherever it appears in the markup.
+    """
+    return str(escape(str(value))) if value is not None else ''
 
-        function updateSelectionCount() {
-            const count = Object.keys(selections).length;
-            document.getElementById('selection-count').textContent = count;
-            document.getElementById('import-btn').disabled = count === 0 || !rebrickableApiKey;
-        }
 
-        async function fetchAllColors() {
-            // Get all unique part IDs that are selected
-            const partIds = new Set();
-            document.querySelectorAll('.select-checkbox:checked').forEach(cb => {
-                partIds.add(cb.dataset.partId);
-            });
+def _prediction_context(piece_index: int, rank: int, item: Dict, item_count: int,
+                        part_images: Dict[str, PartInfo]) -> Dict:
+    """
+    Work out the values the markup for one prediction needs.
 
-            for (const partId of partIds) {
-                await fetchColorsForPart(partId);
-            }
-        }
+    Args:
+        piece_index: Index of the piece the prediction belongs to
+        rank: 1-based rank of the prediction
+        item: Prediction from the Brickognize results
+        item_count: Number of predictions shown for the piece
+        part_images: PartInfo keyed by part number
 
-        async function fetchColorsForPart(partId) {
-            if (colorCache[partId] || !rebrickableApiKey) return;
+    Returns:
+        Dictionary of HTML-escaped template values, plus the part's Rebrickable
+        'variants' (not escaped)
+    """
+    item_id = item.get('id', 'Unknown')
+    score = item.get('score', 0)
+    item_name = item.get('name', '')
+
+    # Get Rebrickable image URL or use placeholder
+    matched_part_num = item_id
+    part_variants = []
+    pinfo = part_images.get(item_id)
+    if pinfo is not None:
+        rebrickable_img_url = _esc(pinfo.img_url)
+        rebrickable_name = pinfo.name
+        matched_part_num = pinfo.part_num
+        part_variants = pinfo.variants
+    else:
+        rebrickable_img_url = _NO_IMAGE_SVG
+        rebrickable_name = item_id
+
+    # Use Rebrickable name if item name not available
+    display_name = item_name if item_name else rebrickable_name
+
+    # Links (use matched part number for Rebrickable, original for BrickLink)
+    rebrickable_link = _REBRICKABLE_PART_URL % matched_part_num
+    bricklink_link = _BRICKLINK_PART_URL % item_id
+
+    # Escape everything that came from an API before it goes into the page
+    item_id, item_category = _esc(item_id), _esc(item.get('category', ''))
+    matched_part_num, display_name = _esc(matched_part_num), _esc(display_name)
+
+    # Auto-select if it's the only prediction or first with high confidence
+    should_preselect = (item_count == 1) or (rank == 1 and score > 0.7)
+
+    return {
+        'piece_index': piece_index,
+        'rank_id': rank,
+        'rank_class': f"rank-{rank}" if rank <= 3 else "rank-other",
+        'top_class': "top" if rank == 1 else "",
+        'selected_class': "selected" if should_preselect else "",
+        'checked_attr': "checked" if should_preselect else "",
+        'disabled_attr': "" if should_preselect else "disabled",
+        'item_id': item_id,
+        'item_type': _esc(item.get('type', 'part')),
+        'part_num': matched_part_num,
+        'name': display_name,
+        'brickognize_img': _esc(item.get('img_url')) or _NO_IMAGE_SVG,
+        'img_url': rebrickable_img_url,
+        'rebrickable_link': _esc(rebrickable_link),
+        'bricklink_link': _esc(bricklink_link),
+        'score_pct': score * 100,
+        'bricklink_note': (f' <span style="font-size: 12px; color: #718096;">(BrickLink: {item_id})</span>'
+                           if matched_part_num != item_id else ''),
+        'name_line': (f'<div style="font-size: 14px; color: #4a5568; margin-bottom: 5px;"><strong>{display_name}</strong></div>'
+                      if display_name and display_name != matched_part_num else ''),
+        'category_tag': (f'<span class="pred-type" style="background: #e6fffa; color: #234e52;">{item_category}</span>'
+                         if item_category else ''),
+        'variants': part_variants
+    }
+
+
+def _variant_context(piece_index: int, rank: int, variant_idx: int, variant: Dict) -> Dict:
+    """
+    Work out the values the markup for one alternative variant of a prediction needs.
 
-            try {
-                const response = await fetch(
-                    `https://rebrickable.com/api/v3/lego/parts/${partId}/colors/`,
-                    {
-                        headers: {
-                            'Authorization': `key ${rebrickableApiKey}`,
-                            'Accept': 'application/json'
-                        }
-                    }
-                );
+    Args:
+        piece_index: Index of the piece the prediction belongs to
+        rank: Rank of the prediction the variant belongs to
+        variant_idx: 0-based position of the variant
+        variant: Rebrickable part data for the variant
 
-                if (response.ok) {
-                    const data = await response.json();
-                    colorCache[partId] = data.results || [];
-                    updateColorSelectors(partId);
-                }
-            } catch (error) {
-                console.error(`Error fetching colors for ${partId}:`, error);
-            }
-        }
+    Returns:
+        Dictionary of HTML-escaped template values
+    """
+    part_num = variant.get('part_num', '')
+    name = variant.get('name', '')
+    rebrickable_link = _REBRICKABLE_PART_URL % part_num
+    bricklink_link = _BRICKLINK_PART_URL % part_num
+    part_num, name = _esc(part_num), _esc(name)
+
+    return {
+        'piece_index': piece_index,
+        'number': variant_idx + 1,
+        'rank_id': f"{rank}_var{variant_idx}",
+        'part_num': part_num,
+        'name': name,
+        'img_url': _esc(variant.get('part_img_url')) or _NO_IMAGE_SVG_SM,
+        'rebrickable_link': _esc(rebrickable_link),
+        'bricklink_link': _esc(bricklink_link),
+        'checked_attr': "",
+        'disabled_attr': "disabled",
+        'name_line': (f'<div style="font-size: 13px; color: #4a5568; margin-bottom: 5px;"><strong>{name}</strong></div>'
+                      if name and name != part_num else '')
+    }
+
+
+def _render_prediction(ctx: Dict, variant: bool = False) -> str:
+    """
+    Render one prediction, or one alternative variant of a prediction.
 
-        function updateColorSelectors(partId) {
-            const selectors = document.querySelectorAll(`select[data-part-id="${partId}"]`);
-            const colors = colorCache[partId] || [];
+    Args:
+        ctx: Template values from _prediction_context or _variant_context
+        variant: Render the smaller variant block, which has no Brickognize
+                 image, type or confidence
 
-            selectors.forEach(select => {
-                select.innerHTML = '<option value="">Select color...</option>';
-                colors.forEach(color => {
-                    const option = document.createElement('option');
-                    option.value = color.color_id;
-                    option.textContent = `${color.color_name} (${color.num_sets} sets)`;
-                    option.style.backgroundColor = `#${color.rgb || 'ffffff'}`;
-                    select.appendChild(option);
-                });
+    Returns:
+        HTML for the prediction
+    """
+    fields = dict(ctx)
+    for name, template in (_VARIANT_PARTS if variant else _PREDICTION_PARTS).items():
+        fields[name] = template % ctx
+    return _PRED_TMPL % fields
 
-                // Restore saved selection if any
-                const pieceIdx = select.id.split('_')[1];
-                if (selections[pieceIdx] && selections[pieceIdx].color) {
-                    select.value = selections[pieceIdx].color;
-                }
 
-                // Add change listener
-                select.addEventListener('change', function() {
-                    const rank = this.id.split('_')[2];
-                    const checkbox = document.getElementById(`select_${pieceIdx}_${rank}`);
-                    if (checkbox.checked) {
-                        selections[pieceIdx].color = this.value;
-                        localStorage.setItem('lego_selections', JSON.stringify(selections));
-                    }
-                });
-            });
-        }
+def _render_piece(idx: int, result: Dict, part_images: Dict[str, PartInfo], items: List[Dict], img_src: str) -> str:
+    """
+    Render the HTML section for one identified piece.
 
-        function loadSavedSelections() {
-            for (const [pieceIdx, data] of Object.entries(selections)) {
-                // Find and check the checkbox
-                const partId = data.partId;
-                const checkbox = document.querySelector(`input[data-piece-idx="${pieceIdx}"][data-part-id="${partId}"]`);
-                if (checkbox) {
-                    checkbox.checked = true;
-                    handleSelection(checkbox);
-                }
-            }
-        }
+    Args:
+        idx: Position of the result in the results list
+        result: Identification result for the piece
+        part_images: PartInfo keyed by part number
+        items: Top predictions to show for the piece
+        img_src: URL of the piece image: a data URI or a path relative to the page ("" if not available)
 
-        function saveSelections() {
-            const blob = new Blob([JSON.stringify(selections, null, 2)], {type: 'application/json'});
-            const url = URL.createObjectURL(blob);
-            const a = document.createElement('a');
-            a.href = url;
-            a.download = 'lego_selections.json';
-            a.click();
-            alert('Selections saved to lego_selections.json');
-        }
+    Returns:
+        HTML for the piece container
+    """
+    html_parts = []
+    piece_index = result.get('piece_index', idx)
+    image_path = result.get('image_path', '')
 
-        function exportJSON() {
-            const exportData = {
-                timestamp: new Date().toISOString(),
-                totalPieces: Object.keys(selections).length,
-                pieces: []
-            };
+    html_parts.append(f'''
+    <div class="piece-container">
+        <div class="piece-header">
+            <div class="piece-number">#{piece_index + 1}</div>
+            <div class="piece-title">
+                <h2 style="margin: 0;">Piece {piece_index + 1}</h2>
+                <small style="color: #718096;">{_esc(os.path.basename(image_path))}</small>
+            </div>
+        </div>
+        <div class="piece-content">
+            <div class="captured-image">
+                <div class="captured-label">YOUR PIECE</div>
+''')
 
-            for (const [pieceIdx, data] of Object.entries(selections)) {
-                const qtyInput = document.querySelector(`input.quantity-input:not([disabled])`);
-                exportData.pieces.push({
-                    pieceIndex: parseInt(pieceIdx),
-                    partId: data.partId,
-                    colorId: data.color,
-                    quantity: data.quantity || 1
-                });
-            }
+    if img_src:
+        # Only the first piece is on screen when the page opens; the browser loads the rest as they scroll in
+        loading = "eager" if idx == 0 else "lazy"
+        html_parts.append(f'                <img src="{img_src}" alt="Piece {piece_index + 1}" loading="{loading}" decoding="async">\n')
+    else:
+        html_parts.append('                <div style="padding: 50px; text-align: center; color: #a0aec0;">Image not available</div>\n')
 
-            const blob = new Blob([JSON.stringify(exportData, null, 2)], {type: 'application/json'});
-            const url = URL.createObjectURL(blob);
-            const a = document.createElement('a');
-            a.href = url;
-            a.download = `lego_export_${Date.now()}.json`;
-            a.click();
-            alert(`Exported ${exportData.totalPieces} pieces to JSON`);
-        }
+    html_parts.append('            </div>\n            <div class="predictions">\n')
 
-        async function importToRebrickable() {
-            if (!rebrickableApiKey) {
-                alert('Please set your Rebrickable API key first');
-                checkApiKey();
-                return;
-            }
+    # Handle errors
+    if result.get('error'):
+        html_parts.append(f'''
+                <div class="error-message">
+                    <strong>Error:</strong> {_esc(result['error'])}
+                </div>
+''')
+    elif not result.get('items'):
+        html_parts.append('                <div class="no-results">No matching pieces found</div>\n')
+    else:
+        # Show predictions
+        for rank, item in enumerate(items, 1):
+            ctx = _prediction_context(piece_index, rank, item, len(items), part_images)
 
-            if (Object.keys(selections).length === 0) {
-                alert('No pieces selected to import');
-                return;
-            }
+            html_parts.append(_render_prediction(ctx))
 
-            const userSetId = prompt('Enter your Rebrickable user set ID (or leave blank to skip)\\nFind it at: https://rebrickable.com/users/YOUR_USERNAME/sets/');
+            if ctx['variants']:
+                html_parts.append(f'''
+                <div style="margin-left: 95px; margin-top: 10px; padding-left: 15px; border-left: 3px solid #e2e8f0;">
+                    <div style="font-size: 12px; font-weight: 600; color: #718096; margin-bottom: 10px;">
+                        ⚡ ALTERNATIVE VARIANTS FOR {ctx['item_id']}:
+                    </div>
+''')
+                for variant_idx, variant in enumerate(ctx['variants']):
+                    vctx = _variant_context(piece_index, rank, variant_idx, variant)
 
-            if (!confirm(`Import ${Object.keys(selections).length} pieces to Rebrickable?`)) {
-                return;
-            }
+                    html_parts.append(_render_prediction(vctx, variant=True))
 
-            const importBtn = document.getElementById('import-btn');
-            importBtn.disabled = true;
-            importBtn.textContent = '⏳ Importing...';
+                html_parts.append('                </div>\n')
 
-            let successCount = 0;
-            let failCount = 0;
+    html_parts.append('            </div>\n        </div>\n    </div>\n')
 
-            for (const [pieceIdx, data] of Object.entries(selections)) {
-                if (!data.color) {
-                    console.warn(`Skipping piece ${pieceIdx}: no color selected`);
-                    failCount++;
-                    continue;
-                }
+    return ''.join(html_parts)
 
-                try {
-                    // Add part to user's collection
-                    const payload = {
-                        part_num: data.partId,
-                        color_id: parseInt(data.color),
-                        quantity: data.quantity || 1
-                    };
 
-                    const endpoint = userSetId
-                        ? `https://rebrickable.com/api/v3/users/me/sets/${userSetId}/parts/`
-                        : 'https://rebrickable.com/api/v3/users/me/parts/';
+def generate_review_html(results: List[Dict], output_path: str, top_n: int = 3,
+                         use_rebrickable: bool = True, api_key: Optional[str] = None,
+                         embed_images: bool = False, prefetch_images: bool = False,
+                         client: Optional[RebrickableClient] = None,
+                         compress: Optional[str] = None) -> str:
+    """
+    Generate an HTML review page for identification results.
 
-                    const response = await fetch(endpoint, {
-                        method: 'POST',
-                        headers: {
-                            'Authorization': `key ${rebrickableApiKey}`,
-                            'Content-Type': 'application/json',
-                            'Accept': 'application/json'
-                        },
-                        body: JSON.stringify(payload)
-                    });
+    Args:
+        results: List of identification results
+        output_path: Path to save the HTML file
+        top_n: Number of top predictions to show per piece
+        use_rebrickable: Whether to fetch images from Rebrickable API (default: True)
+        api_key: Rebrickable API key (optional, will use env var if not provided)
+        embed_images: Embed the piece images in the HTML as base64 (a single portable
+                      file) instead of copying them to an assets directory next to it
+        prefetch_images: Download the Rebrickable part images now and store them like the
+                         piece images, so the page works offline (e.g. for PDF export)
+        client: RebrickableClient to use (and leave open) instead of creating one, so
+                callers rendering several reports share its connections and cache
+        compress: 'gzip' to write the page gzip-compressed to output_path + '.gz'
+                  (for hosting or sending it; browsers do not open it from disk)
 
-                    if (response.ok) {
-                        successCount++;
-                    } else {
-                        console.error(`Failed to import piece ${pieceIdx}:`, await response.text());
-                        failCount++;
-                    }
+    Returns:
+        Path to the generated HTML file
+    """
+    if compress not in (None, 'gzip'):
+        raise ValueError(f"Unsupported compression: {compress}")
+
+    # Count the header stats, pick the predictions to show and collect their unique
+    # part numbers in one pass over the results
+    succeeded = 0
+    top_items = []
+    part_nums = set()
+    for result in results:
+        items = result.get('items')
+        if items and not result.get('error'):
+            succeeded += 1
+            items = items[:top_n]
+            for item in items:
+                part_num = item.get('id')
+                if part_num:
+                    part_nums.add(part_num)
+        else:
+            # Failed pieces show the error or "no results" instead of predictions
+            items = []
+        top_items.append(items)
+    failed = len(results) - succeeded
 
-                    // Rate limiting
-                    await new Promise(resolve => setTimeout(resolve, 200));
+    # Fetch Rebrickable data if enabled
+    part_images = {}
+    part_colors = {}
+    # Only look up parts when there are predictions to show (none for errors or top_n <= 0)
+    if use_rebrickable and part_nums:
+        try:
+            # Try to get API key from multiple sources (not needed with a client)
+            key = None
+            if client is None:
+                key = api_key or get_api_key_from_file() or os.environ.get('REBRICKABLE_API_KEY')
 
-                } catch (error) {
-                    console.error(`Error importing piece ${pieceIdx}:`, error);
-                    failCount++;
-                }
-            }
+            if client or key:
+                print("Fetching part images from Rebrickable API...")
 
-            importBtn.disabled = false;
-            importBtn.textContent = '🚀 Import to Rebrickable';
+                with nullcontext(client) if client else RebrickableClient(api_key=key) as rebrickable:
+                    # Parts looked up in earlier runs come from the client's cache; only the rest are fetched
+                    part_data = rebrickable.get_parts_batch(part_nums)
+                    # Store full part data (including variants if available)
+                    for part_num, data in part_data.items():
+                        if data and data.get('part_img_url'):
+                            part_images[part_num] = PartInfo(
+                                img_url=data['part_img_url'],
+                                name=data.get('name', ''),
+                                part_num=data.get('part_num', part_num),
+                                variants=data.get('variants', []),
+                                original_id=data.get('original_id', part_num)
+                            )
+                    print(f"✓ Fetched images for {len(part_images)} parts")
 
-            alert(`Import complete!\\n✓ Success: ${successCount}\\n✗ Failed: ${failCount}`);
-        }
-    </script>
-</body>
-</html>''')
+                    # Colors for every part the page can select, so the page does not have to fetch them
+                    part_colors = rebrickable.get_colors_batch(
+                        [info.part_num for info in part_images.values()] +
+                        [v['part_num'] for info in part_images.values() for v in info.variants if v.get('part_num')]
+                    )
+                    print(f"✓ Fetched colors for {len(part_colors)} parts")
+                    # Save the new entries now rather than when a shared client is closed
+                    rebrickable.flush()
+            else:
+                print("⚠ Rebrickable API key not found - using placeholder images")
+                print("  Set REBRICKABLE_API_KEY environment variable or create .rebrickable_key file")
+                print("  Get your free API key at: https://rebrickable.com/api/")
+        except Exception as e:
+            print(f"⚠ Could not fetch Rebrickable data: {e}")
+            print("  Continuing with placeholder images...")
 
-    # Write HTML file
-    html_content = ''.join(html_parts)
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+    if embed_images:
+        # Keep the page a single self-contained file
+        stylesheet = f"    <style>\n{_CSS}    </style>\n"
+    else:
+        stylesheet = f'    <link rel="stylesheet" href="{_write_stylesheet(output_path)}">\n'
+
+    # Missing images are simply left out by the loaders below, which saves a stat call per piece
+    image_paths = [path for path in dict.fromkeys(r.get('image_path', '') for r in results) if path]
+    part_img_urls = []
+    if prefetch_images:
+        part_img_urls = list(dict.fromkeys(
+            url for info in part_images.values()
+            for url in [info.img_url] + [v.get('part_img_url') for v in info.variants]
+            if url
+        ))
+
+    if not embed_images and (image_paths or part_img_urls):
+        # e.g. results/photo_review.html -> results/photo_review/assets/
+        assets_dir = Path(output_path).with_suffix('') / 'assets'
+        assets_dir.mkdir(parents=True, exist_ok=True)
+        assets_url = quote(os.path.relpath(assets_dir, os.path.dirname(os.path.abspath(output_path))).replace(os.sep, '/'))
+
+    # Download the Rebrickable images in parallel and point the page at the local copies
+    if part_img_urls:
+        print(f"Downloading {len(part_img_urls)} part images...")
+        workers = min(16, len(part_img_urls))
+        with requests.Session() as session, ThreadPoolExecutor(max_workers=workers) as executor:
+            session.mount('https://', HTTPAdapter(pool_maxsize=workers))
+            downloads = executor.map(partial(_download_image, session), part_img_urls)
+
+            url_map = {}
+            for url, data in zip(part_img_urls, downloads):
+                if not data:
+                    continue
+                suffix = Path(urlparse(url).path).suffix.lower() or '.png'
+                if embed_images:
+                    mime_type = mimetypes.guess_type('image' + suffix)[0] or 'image/png'
+                    url_map[url] = f"data:{mime_type};base64,{b64encode(data).decode('ascii')}"
+                else:
+                    url_map[url] = f"{assets_url}/{_write_asset(data, suffix, assets_dir)}"
+
+        # Copy the variant dicts rather than editing them; they belong to the client's cache
+        for part_num, info in part_images.items():
+            part_images[part_num] = info._replace(
+                img_url=url_map.get(info.img_url, info.img_url),
+                variants=[dict(v, part_img_url=url_map.get(v.get('part_img_url'), v.get('part_img_url')))
+                          for v in info.variants]
+            )
+        print(f"✓ Downloaded {len(url_map)} part images")
+
+    if embed_images:
+        # The base64 is streamed into the page in place of the marker as it is written
+        img_srcs = [_IMAGE_MARKER if r.get('image_path') else '' for r in results]
+    else:
+        # Copy the piece images in parallel; this is mostly waiting on disk
+        img_map = {}
+        if image_paths:
+            with ThreadPoolExecutor(max_workers=min(16, len(image_paths))) as executor:
+                copies = executor.map(partial(_copy_image, out_dir=assets_dir), image_paths)
+                for path, name in zip(image_paths, copies):
+                    if name:
+                        img_map[path] = f"{assets_url}/{name}"
+        img_srcs = [img_map.get(r.get('image_path', ''), '') for r in results]
+
+    # Write the HTML file one piece at a time rather than building the whole page in memory
+    if compress == 'gzip':
+        # Level 1 gets most of the size reduction on this repetitive markup at a fraction of the CPU
+        output_path = f"{output_path}.gz"
+        out = gzip.open(output_path, 'wt', encoding='utf-8', compresslevel=1)
+    else:
+        out = open(output_path, 'w', encoding='utf-8', buffering=1 << 20)
+    with out as f, \
+            ThreadPoolExecutor(max_workers=_READ_AHEAD_WORKERS) if embed_images else nullcontext() as reader:
+        f.writelines((_HEAD_PREFIX, stylesheet,
+                      _HEAD_TOTAL, str(len(results)),
+                      _HEAD_SUCCEEDED, str(succeeded),
+                      _HEAD_FAILED, str(failed),
+                      _HEAD_SUFFIX))
+
+        if embed_images:
+            # Overlap the disk reads of upcoming images with encoding and writing the current one
+            embedded = [r['image_path'] for r in results if r.get('image_path')]
+            images = _read_ahead(reader, embedded, 2 * _READ_AHEAD_WORKERS)
+
+        pieces = map(_render_piece, range(len(results)), results, repeat(part_images), top_items, img_srcs)
+        for piece_html in pieces:
+            before, marker, after = piece_html.partition(_IMAGE_MARKER)
+            f.write(before)
+            if marker:
+                _write_base64_image(f, next(images))
+                f.write(after)
+
+        if part_colors:
+            # "</" is escaped so a color name cannot end the script element
+            colors_json = json.dumps(part_colors, separators=(',', ':')).replace('</', '<\\/')
+            f.write(f"\n    <script>window.__partColors = {colors_json};</script>\n")
+        f.write(_FOOTER)
 
     return output_path
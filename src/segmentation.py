@@ -3,14 +3,16 @@ Image segmentation module for detecting and extracting individual LEGO pieces.
 """
 import cv2
 import numpy as np
-from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 import os
 
 
 class LegoSegmenter:
     """Segments images containing multiple LEGO pieces into individual pieces."""
 
-    def __init__(self, min_area: int = 500, max_area: int = 100000, padding: int = 10):
+    def __init__(self, min_area: int = 500, max_area: int = 100000, padding: int = 10,
+                 detect_size: Optional[int] = None):
         """
         Initialize the LEGO segmenter.
 
@@ -18,10 +20,20 @@ class LegoSegmenter:
             min_area: Minimum contour area to consider as a LEGO piece (filters noise)
             max_area: Maximum contour area to consider as a LEGO piece
             padding: Pixels to add around each detected piece when cropping
+            detect_size: Detect pieces on a copy of the image scaled down so its longest
+                         side is at most this many pixels (None, the default, to use full
+                         resolution). Faster on large photos, but the filters act coarser
+                         on the smaller copy and can merge pieces that lie close together.
+                         Pieces are still cropped from the full-resolution image.
         """
         self.min_area = min_area
         self.max_area = max_area
         self.padding = padding
+        self.detect_size = detect_size
+
+        # Structuring element for cleaning up the threshold mask, shared by every call
+        self._kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+        self._kernel_umat = cv2.UMat(self._kernel) if cv2.ocl.haveOpenCL() else None
 
     def detect_pieces(self, image_path: str) -> Tuple[np.ndarray, List[Tuple[int, int, int, int]]]:
         """
@@ -38,8 +50,21 @@ class LegoSegmenter:
         if image is None:
             raise ValueError(f"Could not read image: {image_path}")
 
+        # Work on a smaller copy of large photos; the pieces are still found at this size
+        # and there are far fewer pixels to filter
+        height, width = image.shape[:2]
+        scale = 1.0
+        detect_image = image
+        if self.detect_size and max(height, width) > self.detect_size:
+            scale = self.detect_size / max(height, width)
+            detect_image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        # Run the filters on the GPU through OpenCV's OpenCL support when there is a device for it
+        if cv2.ocl.haveOpenCL() and cv2.ocl.useOpenCL():
+            detect_image = cv2.UMat(detect_image)
+
         # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        gray = cv2.cvtColor(detect_image, cv2.COLOR_BGR2GRAY)
 
         # Apply Gaussian blur to reduce noise
         blurred = cv2.GaussianBlur(gray, (5, 5), 0)
@@ -54,23 +79,33 @@ class LegoSegmenter:
         )
 
         # Apply morphological operations to clean up the mask
-        kernel = np.ones((3, 3), np.uint8)
+        kernel = self._kernel_umat if isinstance(thresh, cv2.UMat) else self._kernel
         thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel, iterations=2)
         thresh = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel, iterations=1)
+        if isinstance(thresh, cv2.UMat):
+            thresh = thresh.get()
 
         # Find contours
         contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
 
-        # Filter contours by area and get bounding boxes
-        bounding_boxes = []
-        for contour in contours:
-            area = cv2.contourArea(contour)
-            if self.min_area < area < self.max_area:
-                x, y, w, h = cv2.boundingRect(contour)
-                bounding_boxes.append((x, y, w, h))
+        # Filter contours by area and get bounding boxes for the ones that are kept.
+        # The thresholded pieces are mostly outlines, so the area enclosed by the contour
+        # is used rather than a pixel count (e.g. from connectedComponentsWithStats).
+        # The area limits are in full-resolution pixels.
+        areas = np.array([cv2.contourArea(contour) for contour in contours])
+        keep = np.flatnonzero((areas > self.min_area * scale ** 2) & (areas < self.max_area * scale ** 2))
+        boxes = np.array([cv2.boundingRect(contours[i]) for i in keep], dtype=np.int64).reshape(-1, 4)
+
+        if scale != 1.0:
+            # Map the boxes back to the full-resolution image, rounding outwards
+            top_left = np.floor(boxes[:, :2] / scale)
+            bottom_right = np.ceil((boxes[:, :2] + boxes[:, 2:]) / scale)
+            bottom_right = np.minimum(bottom_right, [width, height])
+            boxes = np.hstack([top_left, bottom_right - top_left]).astype(np.int64)
 
         # Sort bounding boxes from left to right, top to bottom
-        bounding_boxes.sort(key=lambda box: (box[1] // 100, box[0]))
+        order = np.lexsort((boxes[:, 0], boxes[:, 1] // 100))
+        bounding_boxes = [tuple(box) for box in boxes[order].tolist()]
 
         return image, bounding_boxes
 
@@ -89,26 +124,63 @@ class LegoSegmenter:
             List of paths to saved piece images
         """
         os.makedirs(output_dir, exist_ok=True)
-        saved_paths = []
+        pieces = self._crop_pieces(image, bounding_boxes)
+        saved_paths = [os.path.join(output_dir, f"{base_name}_{idx:03d}.jpg") for idx in range(len(pieces))]
 
-        height, width = image.shape[:2]
+        # Encode and save the pieces in parallel; OpenCV releases the GIL while it does
+        if pieces:
+            with ThreadPoolExecutor(max_workers=min(len(pieces), os.cpu_count() or 1)) as executor:
+                list(executor.map(cv2.imwrite, saved_paths, pieces))
 
-        for idx, (x, y, w, h) in enumerate(bounding_boxes):
-            # Add padding around the piece
-            x1 = max(0, x - self.padding)
-            y1 = max(0, y - self.padding)
-            x2 = min(width, x + w + self.padding)
-            y2 = min(height, y + h + self.padding)
+        return saved_paths
 
-            # Extract the piece
-            piece = image[y1:y2, x1:x2]
+    def extract_pieces_to_memory(self, image: np.ndarray, bounding_boxes: List[Tuple[int, int, int, int]],
+                                 base_name: str = "piece", quality: int = 90) -> List[Tuple[str, bytes]]:
+        """
+        Extract individual pieces from the image as JPEG data, without saving them.
 
-            # Save the piece
-            output_path = os.path.join(output_dir, f"{base_name}_{idx:03d}.jpg")
-            cv2.imwrite(output_path, piece)
-            saved_paths.append(output_path)
+        Use this when the pieces only need to be uploaded; it skips writing each
+        piece to disk and reading it back.
 
-        return saved_paths
+        Args:
+            image: The original image
+            bounding_boxes: List of bounding boxes (x, y, w, h)
+            base_name: Base name for the piece file names
+            quality: JPEG quality (0-100)
+
+        Returns:
+            List of (file name, JPEG bytes) tuples, one per piece
+        """
+        pieces = self._crop_pieces(image, bounding_boxes)
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+
+        def encode(piece: np.ndarray) -> bytes:
+            ok, buffer = cv2.imencode('.jpg', piece, params)
+            if not ok:
+                raise ValueError("Could not encode piece as JPEG")
+            return buffer.tobytes()
+
+        encoded = []
+        if pieces:
+            with ThreadPoolExecutor(max_workers=min(len(pieces), os.cpu_count() or 1)) as executor:
+                encoded = list(executor.map(encode, pieces))
+
+        return [(f"{base_name}_{idx:03d}.jpg", data) for idx, data in enumerate(encoded)]
+
+    def _crop_pieces(self, image: np.ndarray,
+                     bounding_boxes: List[Tuple[int, int, int, int]]) -> List[np.ndarray]:
+        """Crop each bounding box, plus padding, out of the image (as views, no copies)."""
+        height, width = image.shape[:2]
+        boxes = np.asarray(bounding_boxes, dtype=np.int64).reshape(-1, 4)
+
+        # Add padding around every piece at once, clipped to the image
+        x1 = np.clip(boxes[:, 0] - self.padding, 0, width)
+        y1 = np.clip(boxes[:, 1] - self.padding, 0, height)
+        x2 = np.clip(boxes[:, 0] + boxes[:, 2] + self.padding, 0, width)
+        y2 = np.clip(boxes[:, 1] + boxes[:, 3] + self.padding, 0, height)
+
+        return [image[top:bottom, left:right]
+                for left, top, right, bottom in zip(x1.tolist(), y1.tolist(), x2.tolist(), y2.tolist())]
 
     def visualize_detection(self, image: np.ndarray, bounding_boxes: List[Tuple[int, int, int, int]],
                            output_path: str = None) -> np.ndarray:
@@ -5,6 +5,35 @@ Test script to debug Brickognize API connection.
 import requests
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from api_client import BrickognizeClient
+from segmentation import LegoSegmenter
+
+# Pieces uploaded at once in --segment mode
+UPLOAD_WORKERS = 8
+
+
+def create_session() -> requests.Session:
+    """
+    Create a pooled session for all test requests, so connections are reused.
+
+    Rate limited (429) and failed (5xx) requests, and connection errors, are
+    retried up to 5 times with exponential backoff (up to 16 seconds between
+    attempts), honoring the server's Retry-After header. requests already asks for
+    gzip/deflate compressed responses.
+    """
+    session = requests.Session()
+    retries = Retry(total=5, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504],
+                    allowed_methods=frozenset(['GET', 'POST']), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32, max_retries=retries)
+    session.mount("https://", adapter)
+    return session
+
+
+session = create_session()
 
 
 def test_api_connection():
@@ -14,7 +43,7 @@ def test_api_connection():
     # Test 1: Health check
     print("1. Testing health endpoint...")
     try:
-        response = requests.get("https://api.brickognize.com/health/", timeout=10)
+        response = session.get("https://api.brickognize.com/health/", timeout=10)
         print(f"   Status: {response.status_code}")
         print(f"   Response: {response.text}\n")
     except Exception as e:
@@ -48,7 +77,7 @@ def test_api_connection():
     try:
         with open(test_image, 'rb') as f:
             files = {'query_image': f}
-            response = requests.post(
+            response = session.post(
                 "https://api.brickognize.com/predict/parts/",
                 files=files,
                 timeout=30
@@ -66,7 +95,7 @@ def test_api_connection():
     try:
         with open(test_image, 'rb') as f:
             files = {'query_image': (os.path.basename(test_image), f, 'image/jpeg')}
-            response = requests.post(
+            response = session.post(
                 "https://api.brickognize.com/predict/parts/",
                 files=files,
                 timeout=30
@@ -85,7 +114,7 @@ def test_api_connection():
         with open(test_image, 'rb') as f:
             files = {'query_image': (os.path.basename(test_image), f, 'image/jpeg')}
             headers = {'accept': 'application/json'}
-            response = requests.post(
+            response = session.post(
                 "https://api.brickognize.com/predict/parts/",
                 files=files,
                 headers=headers,
@@ -105,7 +134,7 @@ def test_api_connection():
         with open(test_image, 'rb') as f:
             files = {'query_image': (os.path.basename(test_image), f, 'image/jpeg')}
             headers = {'accept': 'application/json'}
-            response = requests.post(
+            response = session.post(
                 "https://api.brickognize.com/predict/",
                 files=files,
                 headers=headers,
@@ -120,8 +149,44 @@ def test_api_connection():
         print(f"   Error: {e}")
 
 
+def test_segmented_upload(photo: str, save_dir: str = None):
+    """
+    Segment a photo and upload each piece straight from memory.
+
+    Args:
+        photo: Path to a photo containing multiple LEGO pieces
+        save_dir: Also save the pieces to this directory, for inspecting them (optional)
+    """
+    print(f"Segmenting: {photo}")
+    segmenter = LegoSegmenter()
+    image, bounding_boxes = segmenter.detect_pieces(photo)
+    base_name = os.path.splitext(os.path.basename(photo))[0]
+    pieces = segmenter.extract_pieces_to_memory(image, bounding_boxes, base_name)
+    print(f"   Detected {len(pieces)} pieces\n")
+
+    if save_dir:
+        segmenter.extract_pieces(image, bounding_boxes, save_dir, base_name)
+        print(f"   Saved pieces to: {save_dir}\n")
+
+    # The client answers pieces identified on an earlier run from its cache,
+    # which is keyed by the image contents, and uploads the rest
+    with BrickognizeClient(max_workers=UPLOAD_WORKERS) as client, \
+            ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+        results = executor.map(lambda piece: client.identify_image_data(*piece), pieces)
+        for (name, data), result in zip(pieces, results):
+            print(f"   {name} ({len(data)} bytes)")
+            if result.get('error'):
+                print(f"   Error: {result['error']}")
+            else:
+                print(f"   Result: {result}")
+
+
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
+    if len(sys.argv) > 2 and sys.argv[1] == "--segment":
+        # Segment a photo and upload the pieces without writing them to disk
+        # Usage: python test_api.py --segment photo.jpg [save_dir]
+        test_segmented_upload(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
+    elif len(sys.argv) > 1:
         # Use provided image
         test_image = sys.argv[1]
         if os.path.exists(test_image):
@@ -129,7 +194,7 @@ if __name__ == "__main__":
             with open(test_image, 'rb') as f:
                 files = {'query_image': (os.path.basename(test_image), f, 'image/jpeg')}
                 headers = {'accept': 'application/json'}
-                response = requests.post(
+                response = session.post(
                     "https://api.brickognize.com/predict/",
                     files=files,
                     headers=headers,
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Test piece detection in segmentation on a synthetic photo.
+"""
+import os
+import sys
+import tempfile
+sys.path.insert(0, 'src')
+
+import cv2
+import numpy as np
+
+from segmentation import LegoSegmenter
+
+
+def make_photo(path, count=8, size=60, gap=10):
+    """Write a 4000x3000 photo with a row of square bricks, gap pixels apart."""
+    image = np.full((3000, 4000, 3), 235, np.uint8)
+    for i in range(count):
+        x = 300 + i * (size + gap)
+        cv2.rectangle(image, (x, 300), (x + size - 1, 300 + size - 1), (40, 60, 200), -1)
+    cv2.imwrite(path, image)
+
+
+# Pieces lying close together must not be merged by the default settings
+def test_adjacent_pieces():
+    print("=" * 60)
+    print("Testing Detection of Adjacent Pieces")
+    print("=" * 60)
+    print()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        photo = os.path.join(tmp, "adjacent.png")
+        make_photo(photo)
+
+        _, bounding_boxes = LegoSegmenter().detect_pieces(photo)
+        print(f"Detected {len(bounding_boxes)} pieces: {bounding_boxes}")
+
+        assert len(bounding_boxes) == 8, f"expected 8 pieces, got {len(bounding_boxes)}"
+        for i, (x, y, w, h) in enumerate(bounding_boxes):
+            assert (x, y, w, h) == (300 + i * 70, 300, 60, 60), f"piece {i} has box {(x, y, w, h)}"
+
+    print("✓ All adjacent pieces detected separately")
+
+
+if __name__ == "__main__":
+    test_adjacent_pieces()